@@ -0,0 +1,197 @@
+"""
+Benchmarks of the viewer's page functions.
+
+Each page function is timed against a synthetic collection and a stubbed streamlit container and session,
+once with empty caches (`cold`) and then repeatedly with the caches filled (`warm`). Results are written
+as JSON lines so that runs can be compared and scaling with data size can be inspected.
+
+```bash
+python benchmarks/run.py --terms 1000 10000 50000 --backend plotly matplotlib --output bench_output.jsonl
+```
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import pickle
+import argparse
+import itertools
+
+os.environ.setdefault( "MPLBACKEND", "Agg" )
+sys.path.insert( 0, os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), "..", "src" ) )
+
+import synthetic
+import core
+import wrappers
+import instrument
+import cache
+import controls
+import ecotype_summary
+import gene_set_explorer as explorer
+
+
+class StubContainer:
+    """
+    A stand-in for a streamlit container.
+
+    Input widgets return their default value (or the first option), unless a value is given for their label.
+    Output elements do nothing.
+
+    Parameters
+    ----------
+    values : dict
+        Widget labels and the values they should return.
+    """
+    def __init__( self, values = None ):
+        self.values = values or {}
+
+    def _value( self, label, default ):
+        return self.values.get( label, default )
+
+    def selectbox( self, label, options, index = 0, **kwargs ):
+        options = list( options )
+        return self._value( label, options[index] if options else None )
+
+    def slider( self, label, min_value = None, max_value = None, value = None, **kwargs ):
+        return self._value( label, value )
+
+    def number_input( self, label, min_value = None, max_value = None, value = None, **kwargs ):
+        return self._value( label, value )
+
+    def checkbox( self, label, value = False, **kwargs ):
+        return self._value( label, value )
+
+    def text_input( self, label, value = "", **kwargs ):
+        return self._value( label, value )
+
+    def text_area( self, label, value = "", **kwargs ):
+        return self._value( label, value )
+
+    def button( self, label, **kwargs ):
+        return self._value( label, False )
+
+    def download_button( self, label, data, **kwargs ):
+        return False
+
+    def file_uploader( self, label, **kwargs ):
+        return self._value( label, None )
+
+    def columns( self, spec, **kwargs ):
+        n = spec if isinstance( spec, int ) else len( spec )
+        return [ self for _ in range( n ) ]
+
+    def expander( self, label, expanded = False ):
+        return self
+
+    def container( self ):
+        return self
+
+    def __getattr__( self, name ):
+        return lambda *args, **kwargs: None
+
+
+def stub_session():
+    """
+    Replace the streamlit session state of all modules with a plain dictionary.
+    """
+    state = {}
+    for module in ( core, wrappers, instrument, controls, ecotype_summary, explorer ):
+        module.session = state
+    return state
+
+
+def clear_caches():
+    """
+    Empty all process-wide caches.
+    """
+    cache.clear_all()
+
+
+def run_configuration( n_ecotypes, n_celltypes, n_terms, n_subsets, n_patterns, backend, repeat ):
+    """
+    Time all page functions for a single configuration.
+
+    Returns
+    -------
+    list
+        The records of each timed call.
+    """
+    collection = synthetic.make_collection( n_ecotypes, n_celltypes, n_terms )
+    subsets = synthetic.make_subsets( n_subsets, n_patterns )
+    payload = pickle.dumps( collection )
+
+    state = stub_session()
+    container = StubContainer( { "Backend" : backend, "Drop subsets with less than n terms" : 1 } )
+
+    config = dict( 
+                    backend = backend, 
+                    ecotypes = n_ecotypes, 
+                    celltypes = n_celltypes, 
+                    terms = n_terms, 
+                    rows = n_ecotypes * n_celltypes * n_terms, 
+                    subsets = n_subsets, 
+                    patterns = n_patterns,
+                )
+    records = []
+
+    def _time( name, func ):
+        start = time.perf_counter()
+        func()
+        seconds = time.perf_counter() - start
+        records.append( dict( config, function = name, run = run, cache = "cold" if run == 0 else "warm", seconds = seconds ) )
+
+    def _auto_drop_subsets():
+        state["highlight_subsets"] = dict( subsets )
+        explorer.auto_drop_subsets( container )
+        state["highlight_subsets"] = dict( subsets )
+
+    clear_caches()
+    for run in range( repeat ):
+        _time( "core.load", lambda: core.load( io.BytesIO( payload ) ) )
+
+        controls.scatter_figure_controls( container )
+        ecotype_summary.figure_settings( container )
+        _time( "ecotype_summary.view_scatterplots", lambda: ecotype_summary.view_scatterplots( container ) )
+        _time( "ecotype_summary.view_gene_sets", lambda: ecotype_summary.view_gene_sets( container ) )
+
+        _time( "gene_set_explorer.select_dataset", lambda: explorer.select_dataset( container ) )
+        explorer.figure_settings( container )
+        explorer.show_subset_figures( container )
+        explorer.topmost_thresholds( container )
+        state["highlight_subsets"] = dict( subsets )
+
+        _time( "gene_set_explorer.view_subsets", lambda: explorer.view_subsets( container ) )
+        _time( "gene_set_explorer.view_histogram", lambda: explorer.view_histogram( container ) )
+        _time( "gene_set_explorer.auto_drop_subsets", _auto_drop_subsets )
+        _time( "gene_set_explorer.view_gene_sets", lambda: explorer.view_gene_sets( container ) )
+
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser( description = "Benchmark the page functions of the eco_helper viewer on synthetic collections." )
+    parser.add_argument( "--ecotypes", type = int, nargs = "+", default = [ 4 ], help = "The numbers of EcoTypes." )
+    parser.add_argument( "--celltypes", type = int, nargs = "+", default = [ 8 ], help = "The numbers of celltypes/states per EcoType." )
+    parser.add_argument( "--terms", type = int, nargs = "+", default = [ 1000, 10000 ], help = "The numbers of terms per celltype/state." )
+    parser.add_argument( "--subsets", type = int, nargs = "+", default = [ 5 ], help = "The numbers of highlighted subsets." )
+    parser.add_argument( "--patterns", type = int, default = 3, help = "The number of patterns per subset." )
+    parser.add_argument( "--backend", nargs = "+", default = [ "plotly" ], choices = [ "plotly", "matplotlib" ], help = "The plotting backends." )
+    parser.add_argument( "--repeat", type = int, default = 3, help = "The number of runs per configuration (the first one with empty caches)." )
+    parser.add_argument( "--output", default = None, help = "The file to append the results to (as JSON lines). By default the results are printed." )
+    args = parser.parse_args()
+
+    output = open( args.output, "a" ) if args.output else sys.stdout
+    try:
+        for n_ecotypes, n_celltypes, n_terms, n_subsets, backend in itertools.product( args.ecotypes, args.celltypes, args.terms, args.subsets, args.backend ):
+            for record in run_configuration( n_ecotypes, n_celltypes, n_terms, n_subsets, args.patterns, backend, args.repeat ):
+                output.write( json.dumps( record ) + "\n" )
+                output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
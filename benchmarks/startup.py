@@ -0,0 +1,97 @@
+"""
+Import-time (cold start) measurement of the viewer.
+
+The viewer's entry point and the modules of each page are imported, one after another, in a fresh interpreter
+with `python -X importtime`. For each of them, the time their import added is reported in total and per
+(top-level) package, so it is visible which packages a page pulls in and what they cost.
+
+```bash
+python benchmarks/startup.py --repeat 5 --budget 2.0 --output startup.jsonl
+```
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import subprocess
+from collections import defaultdict
+
+SRC = os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), "..", "src" )
+
+STAGES = [ "main", "ecotype_summary", "gene_set_explorer", "term_search" ]
+
+LINE = re.compile( r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$" )
+
+
+def measure( stages = STAGES ):
+    """
+    Import the given modules one after another in a fresh interpreter.
+
+    Parameters
+    ----------
+    stages : list
+        The modules to import, in order. Each one is only charged with the imports it adds.
+
+    Returns
+    -------
+    list
+        A record for each stage, with the import time it added in seconds, and the seconds per package.
+    """
+    code = "; ".join( f"import {i}" for i in stages )
+    env = dict( os.environ, MPLBACKEND = os.environ.get( "MPLBACKEND", "Agg" ) )
+    result = subprocess.run( [ sys.executable, "-X", "importtime", "-c", code ], cwd = SRC, env = env, capture_output = True, text = True )
+    if result.returncode != 0:
+        raise RuntimeError( result.stderr.strip().splitlines()[-1] )
+
+    records = []
+    packages = defaultdict( int )
+    for line in result.stderr.splitlines():
+        match = LINE.match( line )
+        if not match:
+            continue
+        own, cumulative, indent, name = match.groups()
+        packages[ name.split( "." )[0] ] += int( own )
+
+        # a top-level import closes the modules it pulled in
+        if len( indent ) == 1:
+            if name in stages:
+                records.append( dict(
+                                        module = name,
+                                        seconds = int( cumulative ) / 1e6,
+                                        packages = { i : packages[i] / 1e6 for i in sorted( packages, key = packages.get, reverse = True ) },
+                                    ) )
+            packages = defaultdict( int )
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser( description = "Measure the import time of the eco_helper viewer and its pages." )
+    parser.add_argument( "--stages", nargs = "+", default = STAGES, help = "The modules to import, in order (each is charged with the imports it adds)." )
+    parser.add_argument( "--repeat", type = int, default = 3, help = "The number of fresh interpreters to measure (the fastest run is reported)." )
+    parser.add_argument( "--top", type = int, default = 10, help = "The number of most expensive packages to report per stage." )
+    parser.add_argument( "--budget", type = float, default = None, help = "Fail if importing the first stage takes longer than this (in seconds)." )
+    parser.add_argument( "--output", default = None, help = "The file to append the results to (as JSON lines). By default the results are printed." )
+    args = parser.parse_args()
+
+    runs = [ measure( args.stages ) for _ in range( args.repeat ) ]
+    fastest = min( runs, key = lambda run: sum( i["seconds"] for i in run ) )
+
+    output = open( args.output, "a" ) if args.output else sys.stdout
+    try:
+        for record in fastest:
+            record["packages"] = dict( list( record["packages"].items() )[ :args.top ] )
+            record["time"] = time.time()
+            output.write( json.dumps( record ) + "\n" )
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    if args.budget is not None and fastest and fastest[0]["seconds"] > args.budget:
+        sys.exit( f"Importing {fastest[0]['module']} took {fastest[0]['seconds']:.2f}s, exceeding the budget of {args.budget:.2f}s." )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Synthetic collections for benchmarking the viewer.
+"""
+
+import numpy as np
+import pandas as pd
+
+WORDS = [ 
+            "apoptosis", "apoptotic", "cell", "death", "regulation", "positive", "negative", "signaling", "pathway",
+            "immune", "response", "t-cell", "b-cell", "activation", "proliferation", "differentiation", "metabolic",
+            "process", "glycolysis", "oxidative", "phosphorylation", "interferon", "gamma", "alpha", "inflammatory",
+            "cytokine", "receptor", "binding", "transport", "membrane", "mitochondrial", "translation", "ribosome",
+            "dna", "repair", "replication", "cycle", "checkpoint", "hypoxia", "angiogenesis", "migration", "adhesion",
+        ]
+
+PATTERNS = [ 
+                "apopto(sis|tic)", "cell( |-)death", "immun", "t( |-)cell", "b( |-)cell", "interferon", "cytokine",
+                "glycolysis", "oxidative", "mitochondri", "dna( |-)repair", "cell( |-)cycle", "hypoxia", "angiogen",
+                "migrat", "adhesion", "ribosom", "inflammat", "prolifer", "differentiat",
+            ]
+
+
+def make_vocabulary( n_terms, seed = 0 ):
+    """
+    Make a vocabulary of unique gene set terms.
+
+    Parameters
+    ----------
+    n_terms : int
+        The number of terms.
+    seed : int
+        The random seed.
+
+    Returns
+    -------
+    np.ndarray
+        The terms.
+    """
+    rng = np.random.default_rng( seed )
+    lengths = rng.integers( 2, 7, size = n_terms )
+    terms = [ " ".join( rng.choice( WORDS, size = length ) ) + f" (GO:{i:07d})" for i, length in enumerate( lengths ) ]
+    return np.array( terms, dtype = object )
+
+
+def make_collection( n_ecotypes = 4, n_celltypes = 8, n_terms = 1000, vocabulary_size = None, seed = 0 ):
+    """
+    Make a synthetic collection that looks like an `eco_helper.EnrichmentCollection`.
+
+    Parameters
+    ----------
+    n_ecotypes : int
+        The number of EcoTypes.
+    n_celltypes : int
+        The number of celltypes/states per EcoType.
+    n_terms : int
+        The number of enriched terms per celltype/state.
+    vocabulary_size : int
+        The number of unique terms to draw from. By default twice `n_terms`.
+    seed : int
+        The random seed.
+
+    Returns
+    -------
+    dict
+        The EcoType labels and their DataFrames.
+    """
+    rng = np.random.default_rng( seed )
+    vocabulary = make_vocabulary( vocabulary_size or 2 * n_terms, seed )
+    genes = np.array( [ f"GENE{i}" for i in range( 2000 ) ] )
+
+    collection = {}
+    for e in range( n_ecotypes ):
+        frames = []
+        for c in range( n_celltypes ):
+            terms = rng.choice( vocabulary, size = n_terms, replace = n_terms > len( vocabulary ) )
+            score = rng.gamma( 2.0, 2.0, size = n_terms )
+            qval = rng.beta( 0.5, 5.0, size = n_terms ).clip( 1e-300 )
+            frames.append( pd.DataFrame( {
+                                            "CellType" : f"Celltype{c + 1}_State{e + 1}",
+                                            "Term" : terms,
+                                            "Combined Score" : score * -np.log( qval ),
+                                            "log2_score" : np.log2( score ),
+                                            "log10_qval" : -np.log10( qval ),
+                                            "Genes" : [ ";".join( rng.choice( genes, size = 8 ) ) for _ in range( n_terms ) ],
+                                        } ) )
+        collection[ f"E{e + 1}" ] = pd.concat( frames, ignore_index = True )
+    return collection
+
+
+def make_subsets( n_subsets = 5, n_patterns = 3, seed = 0 ):
+    """
+    Make a dictionary of term-subsets.
+
+    Parameters
+    ----------
+    n_subsets : int
+        The number of subsets.
+    n_patterns : int
+        The number of regex patterns per subset.
+    seed : int
+        The random seed.
+
+    Returns
+    -------
+    dict
+        The subset labels and their patterns.
+    """
+    rng = np.random.default_rng( seed )
+    return { f"subset {i + 1}" : list( rng.choice( PATTERNS, size = n_patterns, replace = False ) ) for i in range( n_subsets ) }
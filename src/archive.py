@@ -0,0 +1,236 @@
+"""
+Streamed archives of all tables and figures of a collection.
+
+An archive holds the table of every EcoType and celltype/state (as `tsv` or `parquet`), the highlighted subsets
+and, optionally, the figures and tables of the gene set explorer for each of them (as in `export`). It is written
+in a background thread into a ZIP file on disk, one entry at a time: each entry is generated, compressed into the
+archive and released before the next one is generated, so memory use does not grow with the size of the archive.
+Archives are shared by all sessions (keyed by the collection, subsets and settings) until they are evicted.
+"""
+
+import io
+import os
+import json
+import zipfile
+import tempfile
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import indexes
+import export
+from cache import LRUCache, stable_hash
+
+MAX_ARCHIVES = int( os.environ.get( "ECO_HELPER_VIEWER_CACHED_ARCHIVES", 4 ) )
+ARCHIVE_DIR = os.environ.get( "ECO_HELPER_VIEWER_ARCHIVE_DIR" ) or tempfile.gettempdir()
+
+FORMATS = ( "tsv", "parquet" )
+
+
+def _discard( key, archive ):
+    """
+    Mark an evicted archive as failed, since its file is removed (see `_evict`).
+    """
+    archive.error = "The archive was removed to make room for newer archives. Please prepare it again."
+
+
+archives = LRUCache( max_entries = MAX_ARCHIVES, on_evict = _discard )
+
+executor = ThreadPoolExecutor( max_workers = 1, thread_name_prefix = "archive" )
+
+
+class Archive:
+    """
+    An archive that is (being) written in the background.
+
+    Parameters
+    ----------
+    key : str
+        The hash of the collection, subsets and settings of the archive.
+    path : str
+        The path of the finished archive.
+    """
+    def __init__( self, key, path ):
+        self.key = key
+        self.path = path
+        self.progress = 0.0
+        self.message = "Waiting to start"
+        self.error = None
+        self.future = None
+
+    @property
+    def done( self ):
+        """
+        Check if the archive is finished (or failed).
+        """
+        return self.future is not None and self.future.done()
+
+    @property
+    def failed( self ):
+        """
+        Check if writing the archive failed, or if its file was removed since.
+        """
+        return self.error is not None or ( self.done and not os.path.exists( self.path ) )
+
+    @property
+    def ready( self ):
+        """
+        Check if the archive was written successfully.
+        """
+        return self.done and self.error is None and os.path.exists( self.path )
+
+    def open( self ):
+        """
+        Open the finished archive for reading.
+        """
+        return open( self.path, "rb" )
+
+    def _write( self, entries, total ):
+        """
+        Write the entries to the archive (atomically, via a temporary file).
+        """
+        handle, tmp = tempfile.mkstemp( dir = ARCHIVE_DIR, suffix = ".tmp" )
+        try:
+            with os.fdopen( handle, "wb" ) as f:
+                write( f, entries, total, self._progress )
+            os.replace( tmp, self.path )
+        except Exception as e:
+            self.error = e
+        finally:
+            if os.path.exists( tmp ):
+                os.remove( tmp )
+
+    def _progress( self, fraction, message ):
+        self.progress, self.message = fraction, message
+
+
+def start( collection, subsets = None, settings = None, table_format = "tsv", figures = True, n_per_subset = 0 ):
+    """
+    Start writing the archive of a collection in the background, unless the same archive already exists.
+
+    Parameters
+    ----------
+    collection : FrozenCollection or columnar.LazyCollection
+        The collection to archive.
+    subsets : dict
+        The subset labels and their patterns.
+    settings : dict
+        The gene set and figure settings (see `export.DEFAULT_SETTINGS`).
+    table_format : str
+        The format of the tables, one of `FORMATS`.
+    figures : bool
+        Also add the figures (and their tables) of the gene set explorer for each dataset.
+    n_per_subset : int
+        The number of topmost terms to show per subset (`0` to use the default thresholds of `export` instead).
+
+    Returns
+    -------
+    Archive
+        The archive. Failed archives are started again.
+    """
+    subsets = subsets or {}
+    settings = dict( export.DEFAULT_SETTINGS, **( settings or {} ) )
+    key = stable_hash( dict( collection = collection.key or id( collection ), subsets = subsets, settings = settings, format = table_format, figures = figures, n_per_subset = n_per_subset ) )
+
+    def _start():
+        archive = Archive( key, os.path.join( ARCHIVE_DIR, f"eco_helper_viewer_{os.getpid()}_{key}.zip" ) )
+        index = indexes.of( collection )
+        total = sum( len( index.celltypes( ecotype ) ) for ecotype in index.ecotypes() )
+        archive.future = executor.submit( archive._write, entries( collection, subsets, settings, table_format, figures, n_per_subset ), total )
+        return archive
+
+    archive = archives.get( key )
+    if archive is not None and archive.failed:
+        archives.pop( key )
+    archive = archives.get_or_set( key, _start )
+    _evict()
+    return archive
+
+
+def entries( collection, subsets, settings, table_format = "tsv", figures = True, n_per_subset = 0 ):
+    """
+    Generate the entries of an archive, one at a time.
+
+    Yields
+    ------
+    tuple
+        The name of the entry, its contents (bytes) and the number of the dataset it belongs to (`0` for the subsets).
+    """
+    yield "subsets.json", json.dumps( subsets, indent = 4 ).encode(), 0
+
+    index = indexes.of( collection )
+    number = 0
+    for ecotype in index.ecotypes():
+        for celltype in index.celltypes( ecotype ):
+            number += 1
+            # a dataset of its own (that is not cached), so its rows are released with it rather than kept by the index or the highlighting
+            dataset = indexes.Dataset( collection, ecotype, celltype, index.positions( ecotype, celltype ), shared = False )
+            folder = export.safe_filename( ecotype )
+            basename = export.safe_filename( f"{ecotype}_{celltype}" )
+
+            if not figures:
+                yield f"{folder}/{basename}.{table_format}", _table_bytes( dataset.df, table_format ), number
+                continue
+
+            thresholds = export.dataset_thresholds( dataset.df, settings, None, None, n_per_subset )
+            for suffix, obj in export.dataset_files( dataset, subsets, settings, thresholds ):
+                if isinstance( obj, pd.DataFrame ):
+                    yield f"{folder}/{basename}{suffix}.{table_format}", _table_bytes( obj, table_format ), number
+                else:
+                    name, contents = _figure_bytes( obj, settings["backend"], f"{basename}{suffix}" )
+                    yield f"{folder}/{name}", contents, number
+
+
+def write( file, entries, total = None, progress = None ):
+    """
+    Write entries to a ZIP archive.
+
+    Parameters
+    ----------
+    file : file-like
+        The (binary) file to write the archive to.
+    entries : iterable
+        The names and contents of the entries and the numbers of their datasets (see `entries`).
+    total : int
+        The number of datasets, to report the progress with.
+    progress : callable
+        A function that is called with the fraction of archived datasets and a message.
+    """
+    with zipfile.ZipFile( file, "w", compression = zipfile.ZIP_DEFLATED ) as archive:
+        for name, contents, number in entries:
+            archive.writestr( name, contents )
+            del contents
+            if progress:
+                progress( min( number / total, 1.0 ) if total else 0.0, f"Archived {name}" )
+
+
+def _table_bytes( df, table_format ):
+    """
+    Convert a table to the contents of a file.
+    """
+    if table_format == "parquet":
+        buffer = io.BytesIO()
+        df.to_parquet( buffer, index = False )
+        return buffer.getvalue()
+    return df.to_csv( index = False, sep = "\t" ).encode()
+
+
+def _figure_bytes( fig, backend, basename ):
+    """
+    Convert a figure to the name and contents of a file (html for plotly, png for matplotlib).
+    """
+    if backend == "plotly":
+        return f"{basename}.html", fig.to_html( include_plotlyjs = "cdn" ).encode()
+    import render
+    return f"{basename}.png", render.Rendered( fig, backend ).payload
+
+
+def _evict():
+    """
+    Remove the archive files of this process that are no longer in the cache.
+    """
+    kept = { os.path.basename( archive.path ) for archive in archives.values() }
+    prefix = f"eco_helper_viewer_{os.getpid()}_"
+    for file in os.listdir( ARCHIVE_DIR ):
+        if file.startswith( prefix ) and file.endswith( ".zip" ) and file not in kept:
+            with contextlib.suppress( FileNotFoundError ):
+                os.remove( os.path.join( ARCHIVE_DIR, file ) )
@@ -0,0 +1,209 @@
+"""
+Process-wide caches shared by all sessions.
+"""
+
+import json
+import hashlib
+import weakref
+import threading
+from collections import OrderedDict
+
+
+# every cache, so that all of them can be emptied at once (see `clear_all`)
+_caches = weakref.WeakSet()
+
+
+class LRUCache:
+    """
+    A thread-safe, size-bounded least-recently-used cache.
+
+    Parameters
+    ----------
+    max_entries : int
+        The maximum number of entries to keep. If `None` the number of entries is not bounded.
+    max_bytes : int
+        The maximum combined size (in bytes) of all entries. If `None` the size is not bounded.
+        A single entry that exceeds this limit is still kept (until the next insertion evicts it).
+    on_evict : callable
+        A function that is called with the key and value of each entry that is evicted to keep the cache within its bounds.
+    """
+    def __init__( self, max_entries = None, max_bytes = None, on_evict = None ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.on_evict = on_evict
+        self._data = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.RLock()
+        self._key_locks = {}
+        _caches.add( self )
+
+    def __contains__( self, key ):
+        with self._lock:
+            return key in self._data
+
+    def __len__( self ):
+        with self._lock:
+            return len( self._data )
+
+    @property
+    def nbytes( self ):
+        """
+        The combined size of all entries.
+        """
+        with self._lock:
+            return sum( self._sizes.values() )
+
+    def get( self, key, default = None ):
+        """
+        Get an entry and mark it as recently used.
+        """
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end( key )
+            return self._data[key]
+
+    def values( self ):
+        """
+        Get all entries (without marking them as recently used).
+        """
+        with self._lock:
+            return list( self._data.values() )
+
+    def set( self, key, value, size = 0 ):
+        """
+        Add an entry and evict the least recently used entries if the cache is full.
+
+        Parameters
+        ----------
+        key : hashable
+            The key to store the value under.
+        value : object
+            The value to store.
+        size : int
+            The size of the value in bytes.
+        """
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end( key )
+            self._sizes[key] = size or 0
+            self._evict()
+        return value
+
+    def pop( self, key, default = None ):
+        """
+        Remove an entry from the cache.
+        """
+        with self._lock:
+            self._sizes.pop( key, None )
+            return self._data.pop( key, default )
+
+    def pop_where( self, condition ):
+        """
+        Remove all entries whose key meets a condition.
+        """
+        with self._lock:
+            for key in [ i for i in self._data if condition( i ) ]:
+                self.pop( key )
+
+    def clear( self ):
+        """
+        Remove all entries from the cache.
+        """
+        with self._lock:
+            self._data.clear()
+            self._sizes.clear()
+
+    def get_or_set( self, key, factory, size = None ):
+        """
+        Get an entry or compute and store it if it does not exist.
+
+        Concurrent calls for the same key wait for the first one to finish, so `factory` is only
+        called once per key.
+
+        Parameters
+        ----------
+        key : hashable
+            The key to look up.
+        factory : callable
+            A function without arguments that computes the value.
+        size : int or callable
+            The size of the value in bytes, or a function that computes it from the value.
+        """
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end( key )
+                return self._data[key]
+            key_lock = self._key_locks.setdefault( key, threading.Lock() )
+
+        with key_lock:
+            try:
+                with self._lock:
+                    if key in self._data:
+                        self._data.move_to_end( key )
+                        return self._data[key]
+                value = factory()
+                if callable( size ):
+                    size = size( value )
+                return self.set( key, value, size )
+            finally:
+                with self._lock:
+                    self._key_locks.pop( key, None )
+
+    def _evict( self ):
+        """
+        Drop least recently used entries until the cache is within its bounds.
+        """
+        while len( self._data ) > 1:
+            too_many = self.max_entries is not None and len( self._data ) > self.max_entries
+            too_large = self.max_bytes is not None and sum( self._sizes.values() ) > self.max_bytes
+            if not ( too_many or too_large ):
+                break
+            key = next( iter( self._data ) )
+            value = self.pop( key )
+            if self.on_evict:
+                self.on_evict( key, value )
+
+
+def clear_all():
+    """
+    Empty every cache of the process (e.g. between benchmark runs).
+    """
+    for cache in list( _caches ):
+        cache.clear()
+
+
+def content_hash( data, chunksize = 2**22 ):
+    """
+    Compute a hash of some contents.
+
+    Parameters
+    ----------
+    data : bytes or file-like
+        The contents to hash. File-like objects are read in chunks and rewound afterwards.
+    chunksize : int
+        The number of bytes to read at a time from file-like objects.
+
+    Returns
+    -------
+    str
+        The hex digest of the contents.
+    """
+    digest = hashlib.blake2b( digest_size = 16 )
+    if isinstance( data, ( bytes, bytearray, memoryview ) ):
+        digest.update( data )
+    elif hasattr( data, "getbuffer" ):
+        digest.update( data.getbuffer() )
+    else:
+        data.seek( 0 )
+        for chunk in iter( lambda: data.read( chunksize ), b"" ):
+            digest.update( chunk )
+        data.seek( 0 )
+    return digest.hexdigest()
+
+
+def stable_hash( obj ):
+    """
+    Compute a hash of a JSON-like object (e.g. a settings dictionary) that does not depend on the order of keys.
+    """
+    return content_hash( json.dumps( obj, sort_keys = True, default = str ).encode() )
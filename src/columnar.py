@@ -0,0 +1,310 @@
+"""
+A columnar on-disk format for collections.
+
+Collections are stored as a single Arrow IPC file that holds one record batch per EcoType.
+The labels of the EcoTypes are kept in the schema metadata. Because the Arrow IPC file format
+supports random access to its record batches, opening an EcoType only reads its own partition,
+and only the requested columns are converted to pandas. Files on disk are memory-mapped.
+
+Collections can also be written in the Arrow IPC *stream* format, in which the EcoTypes are stored
+one after another rather than located through a footer. Streams are read lazily, one EcoType at a time,
+so an EcoType can be used as soon as it (and the EcoTypes before it) are read.
+
+`pyarrow` is only imported once a columnar file is actually written or opened.
+
+A pickled collection can be converted to either format via
+
+```bash
+python src/columnar.py collection.p collection.arrow [--stream]
+```
+"""
+
+import os
+import json
+import threading
+import pickle
+import argparse
+from collections.abc import Mapping
+
+from cache import LRUCache
+import normalize
+
+MAGIC = b"ARROW1"
+STREAM_MAGIC = b"\xff\xff\xff\xff"
+ECOTYPES_KEY = b"eco_helper_viewer.ecotypes"
+EXTENSIONS = ( ".arrow", ".feather", ".ipc" )
+
+MAX_CACHED_FRAMES = int( os.environ.get( "ECO_HELPER_VIEWER_CACHED_ECOTYPES", 8 ) )
+
+
+def format_of( source ):
+    """
+    Get the columnar format of a file (path or file-like).
+
+    Returns
+    -------
+    str
+        Either `"file"` or `"stream"`, or `None` if the file is not columnar.
+    """
+    if isinstance( source, ( str, os.PathLike ) ):
+        with open( source, "rb" ) as f:
+            head = f.read( len( MAGIC ) )
+    elif hasattr( source, "getbuffer" ):
+        head = bytes( source.getbuffer()[ :len( MAGIC ) ] )
+    else:
+        head = source.read( len( MAGIC ) )
+        source.seek( 0 )
+    if head == MAGIC:
+        return "file"
+    if head[ :len( STREAM_MAGIC ) ] == STREAM_MAGIC:
+        return "stream"
+    return None
+
+
+def is_columnar( source ):
+    """
+    Check if a file (path or file-like) is stored in a columnar format.
+    """
+    return format_of( source ) is not None
+
+
+def write( collection, path, stream = False ):
+    """
+    Write a collection to a columnar file.
+
+    Parameters
+    ----------
+    collection : dict or eco_helper.EnrichmentCollection
+        The collection to write.
+    path : str
+        The file to write to.
+    stream : bool
+        Write the Arrow IPC stream format instead of the file format.
+    """
+    import pyarrow as pa
+
+    ecotypes = list( collection.keys() )
+    schema = _unify( [ pa.Schema.from_pandas( collection[ecotype], preserve_index = False ) for ecotype in ecotypes ] )
+    schema = schema.with_metadata( { ECOTYPES_KEY : json.dumps( ecotypes ).encode() } )
+    new_writer = pa.ipc.new_stream if stream else pa.ipc.new_file
+
+    with pa.OSFile( str( path ), "wb" ) as sink:
+        with new_writer( sink, schema ) as writer:
+            for ecotype in ecotypes:
+                batch = pa.RecordBatch.from_pandas( collection[ecotype], preserve_index = False )
+                if not batch.schema.equals( schema ):
+                    batch = pa.RecordBatch.from_arrays( [ batch.column( batch.schema.get_field_index( field.name ) ).cast( field.type ) for field in schema ], schema = schema )
+                writer.write_batch( batch )
+
+
+def _unify( schemas ):
+    """
+    Unify the schemas of the EcoTypes of a collection.
+
+    A column may have a different type in some EcoTypes (e.g. integers in one and floats with missing values in another),
+    in which case it gets a common type that all of them are cast to. If all EcoTypes have the same schema, it is kept as is.
+    """
+    import pyarrow as pa
+
+    if all( schema.equals( schemas[0] ) for schema in schemas ):
+        return schemas[0]
+    types = {}
+    for schema in schemas:
+        for field in schema:
+            types.setdefault( field.name, [] ).append( field.type )
+    return pa.schema( [ pa.field( name, _common_type( field_types ) ) for name, field_types in types.items() ] )
+
+
+def _common_type( types ):
+    """
+    The type that the values of all given types can be cast to.
+    """
+    import numpy as np
+    import pyarrow as pa
+
+    types = [ i for i in types if not pa.types.is_null( i ) ] or [ pa.null() ]
+    if all( i.equals( types[0] ) for i in types ):
+        return types[0]
+    if all( pa.types.is_integer( i ) or pa.types.is_floating( i ) for i in types ):
+        return pa.from_numpy_dtype( np.result_type( *[ i.to_pandas_dtype() for i in types ] ) )
+    if all( pa.types.is_dictionary( i ) for i in types ):
+        return pa.dictionary( pa.int32(), _common_type( [ i.value_type for i in types ] ) )
+    return pa.string()
+
+
+class LazyCollection( Mapping ):
+    """
+    A read-only collection backed by a columnar file.
+
+    EcoTypes are only read when they are accessed, and the most recently used ones
+    are kept in memory.
+
+    Parameters
+    ----------
+    source : str or file-like
+        A path to a columnar file (which is memory-mapped) or an in-memory file-like object.
+    key : str
+        An identifier of the source.
+    """
+    def __init__( self, source, key = None ):
+        import pyarrow as pa
+
+        stream = format_of( source ) == "stream"
+        if isinstance( source, ( str, os.PathLike ) ):
+            buffer = pa.memory_map( str( source ), "r" )
+        elif hasattr( source, "getbuffer" ):
+            buffer = pa.BufferReader( pa.py_buffer( source.getbuffer() ) )
+        else:
+            buffer = source
+        self.key = key
+        self._frames = LRUCache( max_entries = MAX_CACHED_FRAMES )
+
+        if stream:
+            self._reader = pa.ipc.open_stream( buffer )
+            self._schema = self._reader.schema
+            self._ecotypes = json.loads( self._schema.metadata[ ECOTYPES_KEY ] )
+            self._batches = []
+            self._lock = threading.Lock()
+            self._get_batch = self._stream_batch
+        else:
+            reader = pa.ipc.open_file( buffer )
+            self._schema = reader.schema
+            self._ecotypes = json.loads( self._schema.metadata[ ECOTYPES_KEY ] )
+            self._get_batch = reader.get_batch
+
+    def __getitem__( self, ecotype ):
+        return self.frame( ecotype )
+
+    def __iter__( self ):
+        return iter( self._ecotypes )
+
+    def __len__( self ):
+        return len( self._ecotypes )
+
+    @property
+    def columns( self ):
+        """
+        The columns of the collection's DataFrames.
+        """
+        return list( self._schema.names )
+
+    @property
+    def nbytes( self ):
+        """
+        The size of the collection's DataFrames that are currently held in memory.
+        """
+        return self._frames.nbytes
+
+    def frame( self, ecotype, columns = None ):
+        """
+        Read the DataFrame of an EcoType.
+
+        Parameters
+        ----------
+        ecotype : str
+            The EcoType to read.
+        columns : list
+            The columns to read. By default all columns are read.
+
+        Returns
+        -------
+        pandas.DataFrame
+            The DataFrame of the EcoType.
+        """
+        if ecotype not in self._ecotypes:
+            raise KeyError( ecotype )
+        columns = tuple( columns ) if columns is not None else None
+        cached = self._frames.get( ( ecotype, None ) )
+        if cached is not None:
+            return cached[ list( columns ) ] if columns is not None else cached
+        return self._frames.get_or_set( ( ecotype, columns ), lambda: self._read( ecotype, columns ), size = _frame_size )
+
+    def project( self, columns ):
+        """
+        Get a dictionary of DataFrames with only the given columns.
+        """
+        return { ecotype : self.frame( ecotype, columns ) for ecotype in self._ecotypes }
+
+    def rows( self, ecotype, positions, columns = None ):
+        """
+        Read the rows at the given positions of an EcoType.
+
+        Only these rows are converted to pandas. Contiguous rows are sliced from the partition 
+        without copying, so numeric columns stay backed by the (memory-mapped) file.
+
+        Parameters
+        ----------
+        ecotype : str
+            The EcoType to read.
+        positions : np.ndarray
+            The (sorted) row positions to read.
+        columns : list
+            The columns to read. By default all columns are read.
+
+        Returns
+        -------
+        pandas.DataFrame
+            The rows, indexed by their positions.
+        """
+        import pyarrow as pa
+
+        batch = self._batch( ecotype, columns )
+        if len( positions ) and positions[-1] - positions[0] + 1 == len( positions ):
+            batch = batch.slice( int( positions[0] ), len( positions ) )
+        else:
+            batch = batch.take( pa.array( positions ) )
+        df = batch.to_pandas( split_blocks = True )
+        df.index = positions
+        return df
+
+    def _batch( self, ecotype, columns = None ):
+        """
+        Get the record batch of an EcoType, optionally with only the given columns.
+        """
+        if ecotype not in self._ecotypes:
+            raise KeyError( ecotype )
+        batch = self._get_batch( self._ecotypes.index( ecotype ) )
+        if columns is not None:
+            import pyarrow as pa
+            batch = pa.RecordBatch.from_arrays( [ batch.column( batch.schema.get_field_index( i ) ) for i in columns ], names = list( columns ) )
+        return batch
+
+    def _stream_batch( self, i ):
+        """
+        Get the i-th record batch of a stream, reading the stream up to it if it was not read that far yet.
+        """
+        with self._lock:
+            while len( self._batches ) <= i:
+                self._batches.append( self._reader.read_next_batch() )
+            return self._batches[i]
+
+    def _read( self, ecotype, columns ):
+        """
+        Read a single partition of the file.
+        """
+        return self._batch( ecotype, columns ).to_pandas()
+
+
+def _frame_size( df ):
+    """
+    The (shallow) memory usage of a DataFrame.
+    """
+    return int( df.memory_usage( index = True, deep = False ).sum() )
+
+
+def main():
+    parser = argparse.ArgumentParser( description = "Convert a pickled collection to the columnar format of the eco_helper viewer." )
+    parser.add_argument( "input", help = "The pickle file of an `eco_helper.EnrichmentCollection` or a dictionary of DataFrames." )
+    parser.add_argument( "output", help = "The columnar file to write." )
+    parser.add_argument( "--stream", action = "store_true", help = "Write the stream format, whose EcoTypes are ingested one at a time." )
+    args = parser.parse_args()
+
+    with open( args.input, "rb" ) as f:
+        collection = pickle.load( f )
+    collection, memory = normalize.normalize( collection )
+    print( f"Normalized the collection from {memory['before'] / 2**20:.1f} MB to {memory['after'] / 2**20:.1f} MB" )
+    write( collection, args.output, stream = args.stream )
+
+
+if __name__ == "__main__":
+    main()
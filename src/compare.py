@@ -0,0 +1,144 @@
+"""
+Comparison of two collections.
+
+Two collections (e.g. of two cohorts or pipeline versions) are joined on their EcoType, celltype/state and term.
+The join is done EcoType by EcoType, so only the key, score and q-value columns of a single EcoType of each
+collection are read at a time. The (`CellType`, `Term`) pairs of the second collection are hashed into an index,
+which the hashed pairs of the first collection are looked up in. The differences of scores and q-values
+(second minus first) are then computed on the joined arrays.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+from cache import LRUCache
+
+MAX_CACHED_JOINS = int( os.environ.get( "ECO_HELPER_VIEWER_CACHED_JOINS", 32 ) )
+
+KEYS = ( "CellType", "Term" )
+
+joins = LRUCache( max_entries = MAX_CACHED_JOINS )
+
+
+def ecotypes( first, second ):
+    """
+    The EcoTypes of both collections, in the order of the first.
+    """
+    other = set( second.keys() )
+    return [ i for i in first.keys() if i in other ]
+
+
+def columns( *compared ):
+    """
+    The names of the compared columns of a join.
+
+    Returns
+    -------
+    dict
+        The column names of the first and second collection's values and their difference, for each compared column.
+    """
+    return { i : dict( first = f"{i} A", second = f"{i} B", delta = f"delta {i}" ) for i in compared }
+
+
+def join( first, second, ecotype, score = "log2_score", qval = "log10_qval" ):
+    """
+    Join an EcoType of two collections on their celltypes/states and terms.
+
+    The join is cached for each pair of collections, EcoType and columns.
+
+    Parameters
+    ----------
+    first, second : FrozenCollection or columnar.LazyCollection
+        The collections to compare.
+    ecotype : str
+        The EcoType to join.
+    score, qval : str
+        The columns to compare.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The `CellType` and `Term` of each pair that is in both collections, the values of the compared columns
+        in both collections (suffixed with `A` and `B`) and their differences (prefixed with `delta`).
+        This is shared and must not be modified.
+    """
+    key = ( first.key or id( first ), second.key or id( second ), ecotype, score, qval )
+    return joins.get_or_set( key, lambda: _join( first, second, ecotype, score, qval ) )
+
+
+def _join( first, second, ecotype, score, qval ):
+    compared = list( dict.fromkeys( [ score, qval ] ) )
+    left = first.frame( ecotype, list( KEYS ) + compared )
+    right = second.frame( ecotype, list( KEYS ) + compared )
+
+    left_hashes = _hash_keys( left )
+    right_hashes = _hash_keys( right )
+
+    # repeated pairs of the second collection are only joined once (with their first row)
+    unique = ~pd.Index( right_hashes ).duplicated()
+    right_rows = np.flatnonzero( unique )
+    index = pd.Index( right_hashes[unique] )
+    positions = index.get_indexer( left_hashes )
+
+    left_rows = np.flatnonzero( positions >= 0 )
+    right_rows = right_rows[ positions[left_rows] ]
+
+    # guard against hash collisions
+    same = np.ones( len( left_rows ), dtype = bool )
+    for column in KEYS:
+        same &= _values( left[column], left_rows ) == _values( right[column], right_rows )
+    left_rows, right_rows = left_rows[same], right_rows[same]
+
+    df = left.iloc[ left_rows ][ list( KEYS ) ].reset_index( drop = True )
+    for column, names in columns( score, qval ).items():
+        a = left[column].to_numpy( dtype = float )[ left_rows ]
+        b = right[column].to_numpy( dtype = float )[ right_rows ]
+        df[ names["first"] ] = a
+        df[ names["second"] ] = b
+        df[ names["delta"] ] = b - a
+    return df
+
+
+def topmost_changes( df, column, n = 10, by = None ):
+    """
+    Get the terms that changed the most in a join.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        The join (see `join`).
+    column : str
+        The compared column whose (absolute) difference ranks the terms.
+    n : int
+        The number of terms to keep (per group).
+    by : str
+        The column to group the terms by, e.g. `CellType`. If None, the topmost terms of the entire join are kept.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The topmost changed terms, by decreasing absolute difference (within each group).
+    """
+    delta = columns( column )[column]["delta"]
+    magnitude = df[delta].abs().to_numpy()
+    if by is None:
+        order = np.argsort( -np.nan_to_num( magnitude, nan = -np.inf ), kind = "stable" )[ :int( n ) ]
+        return df.iloc[ order ].reset_index( drop = True )
+    ranked = df.assign( _magnitude = magnitude ).sort_values( [ by, "_magnitude" ], ascending = [ True, False ], na_position = "last", kind = "mergesort" )
+    return ranked.groupby( by, sort = False, observed = True ).head( int( n ) ).drop( columns = "_magnitude" ).reset_index( drop = True )
+
+
+def _hash_keys( df ):
+    """
+    Hash the (`CellType`, `Term`) pairs of a DataFrame.
+
+    Categorical columns are hashed by their values, so the hashes do not depend on the categories of a collection.
+    """
+    return pd.util.hash_pandas_object( df[ list( KEYS ) ], index = False ).to_numpy()
+
+
+def _values( column, rows ):
+    """
+    The values of some rows of a column, as an object array.
+    """
+    return column.iloc[ rows ].to_numpy( dtype = object )
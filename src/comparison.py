@@ -0,0 +1,182 @@
+"""
+Controls for the comparison page.
+"""
+
+import streamlit as st
+from wrappers import sessionize
+import core
+import controls
+import render
+import instrument
+import compare
+
+session = st.session_state
+
+
+@sessionize(label = "other_datafile")
+def upload_other(container = st):
+    """
+    Upload a second collection to compare the loaded collection with.
+    """
+    return container.file_uploader( "Upload a collection to compare with", help = "A second pickle or columnar collection (e.g. of another cohort or pipeline version). Differences are computed as this collection (B) minus the loaded collection (A)." )
+
+
+@sessionize(label = "comparison_settings")
+def comparison_settings(container = st):
+    """
+    Controls for the compared EcoType and columns.
+    """
+    first, second = core.get( "collection" ), core.get( "other_collection" )
+    datacols = [ i for i in first.columns if i in set( second.columns ) ]
+
+    col1, col2, col3, col4 = container.columns( (2, 2, 2, 1) )
+    ecotype = col1.selectbox( "Ecotype", options = compare.ecotypes( first, second ), help = "The EcoType to compare (only EcoTypes of both collections are listed)." )
+
+    scorecols = list(datacols)
+    scorecols.remove( "log2_score" )
+    scorecols.insert( 0, "log2_score" )
+    score = col2.selectbox( "Score column", options = scorecols, help = "The score to compare (and to rank the changes by)." )
+
+    qvalcols = list(datacols)
+    qvalcols.remove( "log10_qval" )
+    qvalcols.insert( 0, "log10_qval" )
+    qval = col3.selectbox( "q-value column", options = qvalcols, help = "The q-value to compare." )
+
+    n = col4.number_input( "Topmost", min_value = 1, max_value = 50, value = 5, help = "The number of most changed terms to show (per cell-type/state)." )
+    per_celltype = col4.checkbox( "Per cell-type", value = True, help = "Show the most changed terms of each cell-type/state rather than of the entire EcoType." )
+    return dict( ecotype = ecotype, score = score, qval = qval, n = n, per_celltype = per_celltype )
+
+
+@instrument.timed
+def view_differential(container = st):
+    """
+    View the differences of scores and q-values of the terms of an EcoType in both collections.
+    """
+    first, second = core.get( "collection" ), core.get( "other_collection" )
+    settings = dict( core.get( "figure_settings" ) )
+    settings.update( core.get( "comparison_settings" ) )
+    backend = settings["backend"]
+
+    df = compare.join( first, second, settings["ecotype"], settings["score"], settings["qval"] )
+    key = dict( figure = "differential_scatterplot", collections = ( first.key, second.key ), settings = dict( settings ) )
+    names = compare.columns( settings["score"], settings["qval"] )
+
+    def _build():
+        x, y = names[ settings["score"] ]["delta"], names[ settings["qval"] ]["delta"]
+        title = f"{settings['ecotype']}: {len(df)} terms in both collections"
+        if backend == "plotly":
+            return _plotly_differential( df, x, y, title ), df
+        return _matplotlib_differential( df, x, y, title, settings.get( "figsize" ) ), df
+
+    rendered = render.figure( container, key, _build, backend )
+    container.caption( f"{len(df)} of {len(first.frame( settings['ecotype'], [ 'Term' ] ))} terms of {settings['ecotype']} are in both collections." )
+    controls.download( "Download joined table", ( rendered.key, "tsv" ), lambda: df.to_csv( index = False, sep = "\t" ), f"{settings['ecotype']}_comparison.tsv", "text/tsv", container )
+    return rendered
+
+
+@instrument.timed
+def view_topmost_changes(container = st):
+    """
+    View the terms of an EcoType whose scores changed the most between both collections.
+    """
+    first, second = core.get( "collection" ), core.get( "other_collection" )
+    settings = dict( core.get( "figure_settings" ) )
+    settings.update( core.get( "comparison_settings" ) )
+    backend = settings["backend"]
+
+    key = dict( figure = "topmost_changes", collections = ( first.key, second.key ), settings = dict( settings ) )
+
+    def _build():
+        df = compare.join( first, second, settings["ecotype"], settings["score"], settings["qval"] )
+        df = compare.topmost_changes( df, settings["score"], settings["n"], by = "CellType" if settings["per_celltype"] else None )
+        delta = compare.columns( settings["score"] )[ settings["score"] ]["delta"]
+        title = f"Most changed terms in {settings['ecotype']}"
+        if backend == "plotly":
+            return _plotly_topmost_changes( df, delta, title ), df
+        return _matplotlib_topmost_changes( df, delta, title, settings.get( "figsize" ) ), df
+
+    rendered = render.figure( container, key, _build, backend )
+    controls.download( "Download table", ( rendered.key, "tsv" ), lambda: rendered.data.to_csv( index = False, sep = "\t" ), f"{settings['ecotype']}_topmost_changes.tsv", "text/tsv", container )
+    return rendered
+
+
+def _plotly_differential( df, x, y, title ):
+    """
+    Plot the differences of two compared columns (using WebGL).
+    """
+    import plotly.graph_objs as go
+
+    fig = go.Figure()
+    for celltype, group in df.groupby( "CellType", sort = True, observed = True ):
+        fig.add_trace( go.Scattergl(
+                                    x = group[x], y = group[y],
+                                    name = str( celltype ),
+                                    mode = "markers",
+                                    text = group["Term"],
+                                    hovertemplate = "%{text}<br>%{x:.2f}, %{y:.2f}<extra>%{fullData.name}</extra>",
+                                ) )
+    fig.update_layout( title = title, xaxis_title = x, yaxis_title = y )
+    return fig
+
+
+def _matplotlib_differential( df, x, y, title, figsize = None ):
+    """
+    Plot the differences of two compared columns (on its own canvas).
+    """
+    from matplotlib.figure import Figure
+
+    fig = Figure( figsize = figsize )
+    ax = fig.subplots()
+    for celltype, group in df.groupby( "CellType", sort = True, observed = True ):
+        ax.scatter( group[x], group[y], s = 6, linewidths = 0, label = str( celltype ) )
+    ax.axhline( 0, color = "grey", linewidth = 0.5 )
+    ax.axvline( 0, color = "grey", linewidth = 0.5 )
+    ax.set( title = title, xlabel = x, ylabel = y )
+    ax.legend( bbox_to_anchor = (1.01, 1), loc = 2, frameon = False )
+    fig.tight_layout()
+    return fig
+
+
+def _plotly_topmost_changes( df, delta, title ):
+    """
+    Plot the differences of the most changed terms as horizontal bars.
+    """
+    import plotly.graph_objs as go
+
+    fig = go.Figure()
+    for celltype, group in df.groupby( "CellType", sort = False, observed = True ):
+        fig.add_trace( go.Bar(
+                                x = group[delta], y = _labels( group ),
+                                name = str( celltype ),
+                                orientation = "h",
+                                hovertemplate = "%{y}<br>%{x:.2f}<extra>%{fullData.name}</extra>",
+                            ) )
+    fig.update_layout( title = title, xaxis_title = delta, yaxis_autorange = "reversed" )
+    return fig
+
+
+def _matplotlib_topmost_changes( df, delta, title, figsize = None ):
+    """
+    Plot the differences of the most changed terms as horizontal bars (on its own canvas).
+    """
+    from matplotlib.figure import Figure
+
+    fig = Figure( figsize = figsize )
+    ax = fig.subplots()
+    for celltype, group in df.groupby( "CellType", sort = False, observed = True ):
+        ax.barh( group.index, group[delta], label = str( celltype ) )
+    ax.set_yticks( range( len( df ) ) )
+    ax.set_yticklabels( _labels( df ) )
+    ax.invert_yaxis()
+    ax.axvline( 0, color = "grey", linewidth = 0.5 )
+    ax.set( title = title, xlabel = delta )
+    ax.legend( bbox_to_anchor = (1.01, 1), loc = 2, frameon = False )
+    fig.tight_layout()
+    return fig
+
+
+def _labels( df ):
+    """
+    Label terms with their celltype/state (since the same term may change in several of them).
+    """
+    return [ f"{term} ({celltype})" for term, celltype in zip( df["Term"], df["CellType"] ) ]
@@ -2,13 +2,16 @@
 General controls
 """
 
+import os
 import streamlit as st
 from wrappers import sessionize
 from core import to_pickle, get
-import eco_helper.enrich.visualise as visualise 
+from cache import LRUCache
 
 session = st.session_state
 
+downloads = LRUCache( max_entries = int( os.environ.get( "ECO_HELPER_VIEWER_CACHED_DOWNLOADS", 64 ) ), max_bytes = int( os.environ.get( "ECO_HELPER_VIEWER_DOWNLOAD_CACHE_MB", 512 ) ) * 2**20 )
+
 @sessionize(label = "figure_settings" )
 def scatter_figure_controls(container = st):
     """
@@ -37,14 +40,14 @@ def scatter_figure_controls(container = st):
     
     return settings
 
-def download_figure( fig, filename = None, suffix = None, container = st):
+def download_figure( rendered, filename = None, suffix = None, container = st):
     """
     Download summary figure.
     
     Parameters
     ----------
-    fig : matplotlib.figure.Figure or plotly.graph_objects.Figure
-        The figure to download.
+    rendered : render.Rendered
+        The rendered figure to download.
     filename : str
         The filename to save the figure as. If none is provided, the filename is assembled from the currently loaded dataset.
     suffix : str
@@ -54,23 +57,50 @@ def download_figure( fig, filename = None, suffix = None, container = st):
     """
     if filename is None:
         dataset = get( "gene_set" )
-        ecotype = dataset._ecotype
-        celltype = dataset._celltype
+        ecotype = dataset.ecotype
+        celltype = dataset.celltype
         filename = f"{ecotype}_{celltype}"
 
     if suffix is not None:
         filename = f"{filename}.{suffix}"
         
-    if not fig:
+    if not rendered:
         return
-    if visualise.backend == "plotly":
-        container.download_button( "Download Figure (html)", fig.to_html(), mime="text/html", file_name = f"{filename}.html" )
-        picklefig = to_pickle( fig )
-
+    if rendered.backend == "plotly":
+        download( "Download Figure (html)", ( rendered.key, "html" ), lambda: rendered.figure.to_html(), f"{filename}.html", "text/html", container )
     else:
-    #     download = container.button( "Download Figure (png)", key = filename )
-    #     if download:
-    #         fig.savefig( f"{filename}.png", dpi = 500 )
-        picklefig = to_pickle( fig )
+        container.download_button( "Download Figure (png)", rendered.payload, mime = "image/png", file_name = f"{filename}.png", key = f"download_{filename}.png" )
+
+    download( "Download Figure (pickle)", ( rendered.key, "pickle" ), lambda: to_pickle( rendered.figure ), f"{filename}.{rendered.backend}.p", "bytes", container )
+
+def download( label, key, build, file_name, mime, container = st, help = None ):
+    """
+    Offer a download whose contents are only generated when requested.
+
+    Until the contents exist, a button to prepare the download is shown instead. Once generated, 
+    the contents are cached under the identity of the downloaded object, so they are shared across reruns and sessions.
 
-    container.download_button( "Download Figure (pickle)", picklefig, mime="bytes", file_name = f"{filename}.{visualise.backend}.p" )
\ No newline at end of file
+    Parameters
+    ----------
+    label : str
+        The label of the download button.
+    key : hashable
+        The identity of the downloaded object (e.g. a dataset or render cache key and the format).
+    build : callable
+        A function without arguments that generates the contents.
+    file_name : str
+        The name of the downloaded file.
+    mime : str
+        The mime type of the downloaded file.
+    container : streamlit.container
+        The container to use for the controls.
+    help : str
+        The help text of the download button.
+    """
+    payload = downloads.get( key )
+    if payload is None:
+        prepare = container.button( label.replace( "Download", "Prepare", 1 ), key = f"prepare_{file_name}", help = "Generate the file for download." )
+        if not prepare:
+            return
+        payload = downloads.get_or_set( key, build, size = len )
+    container.download_button( label, payload, file_name = file_name, mime = mime, help = help, key = f"download_{file_name}" )
@@ -5,6 +5,10 @@ Core functions for the viewer
 import pickle
 import streamlit as st
 from wrappers import sessionize
+import store
+import indexes
+import search
+import summary
 
 session = st.session_state
 
@@ -24,11 +28,58 @@ def get( value ):
 @sessionize( label = "collection" )
 def load( filename ):
     """
-    Load a pickle file.
+    Load a pickle or columnar file.
+
+    Collections are shared between all sessions of the server process, so uploading a file
+    that is already loaded elsewhere does not unpickle it again. The returned collection is read-only.
+    The row index of the collection is built alongside and stored as `collection_index`,
+    and so are the term index used by the term search (see `search`) and the default summary of the overview (see `summary`).
+    The progress of each is shown while they are built.
     """
-    data = pickle.loads( filename.read() )
+    bar, status = st.progress( 0 ), st.empty()
+
+    def _progress( fraction, message ):
+        bar.progress( min( int( 100 * fraction ), 100 ) )
+        status.caption( message )
+
+    data = store.open_collection( filename, progress = _progress )
+    session["collection_index"] = indexes.of( data, progress = _progress )
+    search.of( data, progress = _progress )
+    summary.of( data, progress = _progress )
+    session["datafile_id"] = file_id( filename )
+    bar.empty()
+    status.empty()
     return data
 
+@sessionize( label = "other_collection" )
+def load_other( filename ):
+    """
+    Load a second collection to compare the loaded collection with (see `compare`).
+
+    Like `load`, the collection is shared between all sessions. Only the collection itself is loaded,
+    the EcoTypes of both collections are joined when they are compared.
+    """
+    bar, status = st.progress( 0 ), st.empty()
+
+    def _progress( fraction, message ):
+        bar.progress( min( int( 100 * fraction ), 100 ) )
+        status.caption( message )
+
+    data = store.open_collection( filename, progress = _progress )
+    session["other_datafile_id"] = file_id( filename )
+    bar.empty()
+    status.empty()
+    return data
+
+def file_id( filename ):
+    """
+    Get an identifier of an uploaded file that changes whenever a new file is uploaded.
+    Files on the server are identified by their path.
+    """
+    if isinstance( filename, str ):
+        return filename
+    return getattr( filename, "id", id( filename ) )
+
 def to_pickle( obj ):
     """
     Convert an object to a pickle file.
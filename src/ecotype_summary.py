@@ -2,15 +2,27 @@
 Controls for the ecotype summary page.
 """
 
+import os
 import streamlit as st
 from wrappers import sessionize
 from core import check, get, to_pickle
+from cache import LRUCache
 import controls
+import render
+import instrument
+import normalize
+import summary
+import numpy as np
 import pandas as pd
 import eco_helper.enrich.visualise as visualise
 
 session = st.session_state
 
+_topmost_cache = LRUCache( max_entries = int( os.environ.get( "ECO_HELPER_VIEWER_CACHED_TOPMOST", 64 ) ) )
+
+WEBGL_POINTS = int( os.environ.get( "ECO_HELPER_VIEWER_WEBGL_POINTS", 10000 ) )
+DENSITY_BINS = 200
+
 @sessionize(label = "ecotype_summary_settings")
 def figure_settings(container = st):
 
@@ -19,7 +31,7 @@ def figure_settings(container = st):
     col1, col2 = container.columns(2)
 
     collection = get("collection")
-    datacols = list( collection["E1"].columns )
+    datacols = collection.columns
 
     xcols = list(datacols)
     xcols.remove( "log2_score" )
@@ -43,10 +55,66 @@ def figure_settings(container = st):
     
     size = col1.selectbox( "Size", options = stylecols, help = "The column to use for the marker-size" )
 
+    aggregate_above = col2.number_input( "Aggregate above n terms", min_value = 0, value = 100000, step = 10000, help = "If the collection contains more terms than this, terms below the thresholds are binned into a density grid on the server and only terms above both thresholds are drawn individually. Set to `0` to never aggregate." )
+    x_threshold = col1.number_input( "x-threshold", value = 1.0, step = 0.1, help = "Terms above both thresholds are drawn individually when aggregating." )
+    y_threshold = col2.number_input( "y-threshold", value = 1.3, step = 0.1, help = "Terms above both thresholds are drawn individually when aggregating." )
    
-    return dict( x = x, y = y, hue = hue, style = style, size = size )
+    return dict( x = x, y = y, hue = hue, style = style, size = size, aggregate_above = aggregate_above, x_threshold = x_threshold, y_threshold = y_threshold )
+
+@sessionize
+def summary_mode(container = st):
+    """
+    Choose between the overview of the collection and the full scatterplot of all its terms.
+    """
+    return container.radio( "View", options = [ "Overview", "Full scatterplot" ], help = "The overview is built from summary statistics of each celltype/state and opens instantly. The full scatterplot plots every term of every ecotype." )
+
+@instrument.timed
+def view_overview(container = st):
+    """
+    View the overview of the collection.
+
+    This shows the number of terms above the thresholds in each celltype/state of each ecotype, 
+    and a table of summary statistics and top terms. It is built from the collection's summary (see `summary`),
+    so no terms are plotted.
+    """
+    collection = get( "collection" )
+    if not collection:
+        return 
+
+    settings = dict( get( "figure_settings" ) ) 
+    settings.update( get( "ecotype_summary_settings" ) ) 
+    backend = settings["backend"]
+
+    columns = ( settings["x"], settings["y"] )
+    numeric = summary.numeric_columns( collection, columns )
+    if any( i not in numeric for i in columns ):
+        other = ", ".join( f"`{i}`" for i in columns if i not in numeric )
+        container.warning( f"The overview can only summarize numeric columns. Choose numeric x- and y-columns (instead of {other}), or view the full scatterplot." )
+        return
+
+    table = summary.of( collection, settings["x"], settings["y"], settings["x_threshold"], settings["y_threshold"] )
+    if table.empty:
+        container.info( "The collection has no terms to summarize." )
+        return
+    key = dict( figure = "overview", collection = collection.key, settings = dict( settings ) )
+
+    def _build():
+        counts = summary.pivot( table, "above thresholds" )
+        totals = summary.pivot( table, "terms" )
+        title = f"Terms above thresholds ({settings['x']} > {settings['x_threshold']}, {settings['y']} > {settings['y_threshold']})"
+        if backend == "plotly":
+            return _plotly_overview( counts, totals, title ), table
+        return _matplotlib_overview( counts, title, settings.get( "figsize" ) ), table
+
+    rendered = render.figure( container, key, _build, backend )
+
+    table_ext = container.expander( "Summary table", expanded = False )
+    table_ext.dataframe( table )
+    controls.download( "Download table", ( rendered.key, "tsv" ), lambda: table.to_csv( index = False, sep = "\t" ), "ecotypes_overview.tsv", "text/tsv", container )
+    return rendered
 
 # @sessionize(label = "raw_figure" )
+@instrument.timed
 def view_scatterplots(container = st):
     """
     View the summary of the collection.
@@ -58,24 +126,43 @@ def view_scatterplots(container = st):
     settings = dict( get( "figure_settings" ) ) 
     settings.update( get( "ecotype_summary_settings" ) ) 
 
+    key = dict( figure = "collection_scatterplot", collection = collection.key, settings = dict( settings ) )
     visualise.backend = settings.pop( "backend" )
 
-    if visualise.backend == "plotly":
-        settings.pop("padding")
-        fig = visualise.collection_scatterplot( collection, **settings )
-        container.plotly_chart( fig, use_container_width = True )
-    else:
+    def _build():
+        columns = { "Term", "CellType" } | { settings[i] for i in ( "x", "y", "hue", "style", "size" ) if settings[i] }
+        data = collection.project( [ i for i in collection.columns if i in columns ] )
+
+        aggregate_above = settings.pop( "aggregate_above" )
+        thresholds = settings.pop( "x_threshold" ), settings.pop( "y_threshold" )
+        n_points = sum( len( data[ecotype] ) for ecotype in data.keys() )
+        aggregate = aggregate_above and n_points > aggregate_above
+
+        if visualise.backend == "plotly":
+            settings.pop("padding")
+            if aggregate:
+                return _plotly_density_scatterplot( data, *thresholds, **settings )
+            fig = visualise.collection_scatterplot( data, **settings )
+            if n_points > WEBGL_POINTS:
+                fig = _to_webgl( fig )
+            return fig
+
         padding = settings.pop( "padding" )
         despine = settings.pop( "despine" )
-        fig = visualise.collection_scatterplot( collection, **settings )
+        if aggregate:
+            fig = _matplotlib_density_scatterplot( data, *thresholds, **settings )
+        else:
+            fig = visualise.collection_scatterplot( data, **settings )
         fig.tight_layout( pad = padding )
         if despine:
             visualise.sns.despine()
+        return fig
 
-        container.pyplot( fig, dpi = 500 )
-    return fig
+    rendered = render.figure( container, key, _build, visualise.backend, dpi = 500 )
+    return rendered
 
 
+@instrument.timed
 def view_gene_sets(container = st):
     """
     View topmost enriched gene sets for each cell type in each ecotype
@@ -93,16 +180,18 @@ def view_gene_sets(container = st):
     ecotype = col1.selectbox( "Ecotype", options = list(collection.keys()) )
     view_n_topmost( col2 )
 
-    if visualise.backend == "plotly":
-        fig, df = _plotly_gene_sets_of_ecotype( ecotype, collection[ecotype] )
-        container.plotly_chart( fig, use_container_width = True )
+    key = dict( figure = "gene_sets_of_ecotype", collection = collection.key, ecotype = ecotype, n = get( "view_n_topmost" ), settings = dict( settings ), backend = visualise.backend )
 
-    if visualise.backend == "matplotlib":
-        fig, df = _matplotlib_gene_sets_of_ecotype( ecotype, collection[ecotype] )
-        container.pyplot( fig, dpi = 500 )
-    
-    container.download_button( "Download table", df.to_csv(index=False, sep = "\t"), file_name = "gene_sets.tsv", mime = "text/tsv" )
-    return fig
+    def _build():
+        columns = { "Term", "CellType", settings.get("x"), settings.get("y"), settings.get("hue") }
+        df = collection.frame( ecotype, [ i for i in collection.columns if i in columns ] )
+        if visualise.backend == "plotly":
+            return _plotly_gene_sets_of_ecotype( ecotype, df )
+        return _matplotlib_gene_sets_of_ecotype( ecotype, df )
+
+    rendered = render.figure( container, key, _build, visualise.backend, dpi = 500 )
+    controls.download( "Download table", ( rendered.key, "tsv" ), lambda: rendered.data.to_csv(index=False, sep = "\t"), f"{ecotype}_gene_sets.tsv", "text/tsv", container )
+    return rendered
 
 @sessionize
 def view_n_topmost(container = st):
@@ -118,7 +207,6 @@ def _matplotlib_gene_sets_of_ecotype( ecotype, df ):
 
     plt = visualise.plt
     sns = visualise.sns
-    pd = visualise.pd
 
     n = get( "view_n_topmost" )
     x, y = settings.get("x"), settings.get("y")
@@ -126,14 +214,7 @@ def _matplotlib_gene_sets_of_ecotype( ecotype, df ):
     sns.set_palette( settings.get( "palette" ) )
 
     fig, ax = plt.subplots( figsize = settings.pop("figsize", None) )
-    groups = df.groupby( settings.get("hue") )
-    df = []
-    for celltype, group in groups:
-        group = group.sort_values( by = x, ascending = False )
-        group = group.sort_values( by = y, ascending = False )
-        group = group.head( int(n) )
-        df.append( group )
-    df = pd.concat( df )
+    df = topmost_per_group( ecotype, df, x, y, settings.get("hue"), n )
 
     sns.scatterplot(    data = df, 
                         x = x, y = "Term", 
@@ -165,13 +246,8 @@ def _plotly_gene_sets_of_ecotype( ecotype, df ):
     x, y = settings.get("x"), settings.get("y")
 
     fig = go.Figure()
-    groups = df.groupby( settings.get("hue") )
-    df = []
-    for celltype, group in groups:
-        group = group.sort_values( by = x, ascending = False )
-        group = group.sort_values( by = y, ascending = False )
-        group = group.head( int(n) )
-        df.append( group )
+    df = topmost_per_group( ecotype, df, x, y, settings.get("hue"), n )
+    for celltype, group in df.groupby( settings.get("hue"), sort = False, observed = True ):
         fig.add_trace( go.Scatter( 
                                     x = group[x], y = group["Term"], 
                                     name = celltype,
@@ -190,4 +266,142 @@ def _plotly_gene_sets_of_ecotype( ecotype, df ):
         xaxis_title = settings.get("xlabel", x),
     )   
 
-    return fig, pd.concat( df )
+    return fig, df
+
+def topmost_per_group( ecotype, df, x, y, hue, n ):
+    """
+    Get the topmost `n` terms (by `y`, then `x`) of each group in an ecotype.
+
+    The result is cached for each ecotype, so it is shared by both backends and across reruns.
+
+    Parameters
+    ----------
+    ecotype : str
+        The ecotype the DataFrame belongs to.
+    df : pandas.DataFrame
+        The ecotype's DataFrame.
+    x, y : str
+        The columns to rank the terms by.
+    hue : str
+        The column to group the terms by.
+    n : int
+        The number of terms to keep per group.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The topmost terms of each group, with groups in sorted order.
+    """
+    key = ( getattr( get( "collection" ), "key", None ), ecotype, x, y, hue, int(n) )
+
+    def _select():
+        ranked = df[ df[hue].notna() ].sort_values( by = [ hue, y, x ], ascending = [ True, False, False ], kind = "mergesort" )
+        return normalize.compact( ranked.groupby( hue, sort = False, observed = True ).head( int(n) ) )
+
+    return _topmost_cache.get_or_set( key, _select )
+
+def _stack( data, columns ):
+    """
+    Stack the DataFrames of all ecotypes into one, with an additional `EcoType` column.
+    """
+    columns = list( dict.fromkeys( columns ) )
+    frames = [ data[ecotype][columns].assign( EcoType = ecotype ) for ecotype in data.keys() ]
+    return pd.concat( frames, ignore_index = True )
+
+def _split_by_thresholds( data, x, y, hue, x_threshold, y_threshold ):
+    """
+    Split the terms of all ecotypes into those above both thresholds and the rest.
+    """
+    df = _stack( data, [ x, y, hue, "Term" ] ).dropna( subset = [ x, y ] )
+    above = ( df[x] > x_threshold ) & ( df[y] > y_threshold )
+    return df[above], df[~above]
+
+def _plotly_density_scatterplot( data, x_threshold, y_threshold, x, y, hue, xlabel = None, ylabel = None, **kwargs ):
+    """
+    Plot the terms of all ecotypes as a density grid, with only the terms above both thresholds drawn individually (using WebGL).
+    """
+    import plotly.graph_objs as go
+
+    above, below = _split_by_thresholds( data, x, y, hue, x_threshold, y_threshold )
+    counts, xedges, yedges = np.histogram2d( below[x], below[y], bins = DENSITY_BINS )
+    density = np.where( counts > 0, np.log10( counts + 1 ), np.nan )
+
+    fig = go.Figure()
+    fig.add_trace( go.Heatmap( 
+                                z = density.T, 
+                                x = ( xedges[:-1] + xedges[1:] ) / 2, 
+                                y = ( yedges[:-1] + yedges[1:] ) / 2, 
+                                text = counts.T,
+                                hovertemplate = "%{text} terms<extra></extra>",
+                                colorscale = "Greys", 
+                                showscale = False,
+                                name = "density",
+                            ) )
+    for label, group in above.groupby( hue, sort = True, observed = True ):
+        fig.add_trace( go.Scattergl( 
+                                    x = group[x], y = group[y], 
+                                    name = str( label ),
+                                    mode = "markers",
+                                    text = group["Term"],
+                                    customdata = group["EcoType"],
+                                    hovertemplate = "%{text}<br>%{customdata}<extra>%{fullData.name}</extra>",
+                                ) )
+    fig.update_layout( 
+        title = f"{len(below)} terms aggregated, {len(above)} terms above thresholds",
+        xaxis_title = xlabel or x,
+        yaxis_title = ylabel or y,
+    )
+    return fig
+
+def _matplotlib_density_scatterplot( data, x_threshold, y_threshold, x, y, hue, figsize = None, palette = None, xlabel = None, ylabel = None, **kwargs ):
+    """
+    Plot the terms of all ecotypes as a hexagonal density grid, with only the terms above both thresholds drawn individually.
+    """
+    above, below = _split_by_thresholds( data, x, y, hue, x_threshold, y_threshold )
+
+    fig, ax = visualise.plt.subplots( figsize = figsize )
+    if len( below ):
+        ax.hexbin( below[x], below[y], gridsize = DENSITY_BINS // 2, bins = "log", cmap = "Greys", mincnt = 1, linewidths = 0 )
+    visualise.sns.scatterplot( data = above, x = x, y = y, hue = hue, palette = palette, s = 12, linewidth = 0, ax = ax )
+    ax.set( xlabel = xlabel or x, ylabel = ylabel or y )
+    ax.legend( bbox_to_anchor = (1.01, 1), loc = 2, frameon = False )
+    return fig
+
+def _plotly_overview( counts, totals, title ):
+    """
+    Plot the numbers of terms above the thresholds as a heatmap of ecotypes and celltypes/states.
+    """
+    import plotly.graph_objs as go
+
+    fig = go.Figure( go.Heatmap( 
+                                z = counts.values, 
+                                x = [ str( i ) for i in counts.columns ], 
+                                y = [ str( i ) for i in counts.index ], 
+                                customdata = totals.reindex_like( counts ).values,
+                                hovertemplate = "%{y}, %{x}<br>%{z} of %{customdata} terms<extra></extra>",
+                                colorscale = "Blues",
+                            ) )
+    fig.update_layout( title = title, yaxis_autorange = "reversed" )
+    return fig
+
+def _matplotlib_overview( counts, title, figsize = None ):
+    """
+    Plot the numbers of terms above the thresholds as a heatmap of ecotypes and celltypes/states (on its own canvas).
+    """
+    from matplotlib.figure import Figure
+
+    fig = Figure( figsize = figsize )
+    ax = fig.subplots()
+    visualise.sns.heatmap( counts, annot = counts.size <= 400, fmt = ".0f", cmap = "Blues", ax = ax )
+    ax.set( title = title, xlabel = "", ylabel = "" )
+    fig.tight_layout()
+    return fig
+
+def _to_webgl( fig ):
+    """
+    Convert the scatter traces of a plotly figure to WebGL traces.
+    """
+    import plotly.graph_objs as go
+
+    traces = [ go.Scattergl( trace.to_plotly_json(), skip_invalid = True ) if trace.type == "scatter" else trace for trace in fig.data ]
+    return go.Figure( data = traces, layout = fig.layout )
@@ -0,0 +1,237 @@
+"""
+Headless batch export of the gene set explorer's figures and tables.
+
+This renders the subsets scatterplot, the fractions and the topmost figures (and their tables) for every
+EcoType and celltype/state of a collection in a process pool and writes them to an output directory.
+Pairs whose data, subsets and settings did not change since the last export are skipped.
+
+```bash
+python src/export.py collection.p figures/ --subsets subsets.json --settings settings.json --workers 8
+```
+"""
+
+import os
+import re
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+import store
+import indexes
+import patterns
+from cache import content_hash, stable_hash
+
+EXPORT_VERSION = 1
+MANIFEST = "manifest.json"
+
+DEFAULT_SETTINGS = dict( 
+                            backend = "plotly", 
+                            x = "log2_score", 
+                            y = "log10_qval", 
+                            style = None, 
+                            size = None, 
+                            ref = "Term", 
+                            xlabel = "log2(score)", 
+                            ylabel = "-log10(qval)", 
+                            padding = 3.0,
+                            figsize = ( 10, 4 ), 
+                            despine = True, 
+                            palette = "colorblind",
+                        )
+
+
+def export_collection( collection, outdir, subsets = None, settings = None, x_threshold = None, y_threshold = None, n_per_subset = 0, workers = None, force = False ):
+    """
+    Export the figures and tables of all datasets in a collection.
+
+    Parameters
+    ----------
+    collection : FrozenCollection or columnar.LazyCollection
+        The collection to export.
+    outdir : str
+        The directory to write to.
+    subsets : dict
+        The subset labels and their patterns.
+    settings : dict
+        The gene set and figure settings (see `DEFAULT_SETTINGS`).
+    x_threshold, y_threshold : float
+        The topmost thresholds. By default 65% of each dataset's maximum are used (as in the explorer).
+    n_per_subset : int
+        The number of topmost terms to show per subset (`0` to use the thresholds instead).
+    workers : int
+        The number of worker processes.
+    force : bool
+        Export all datasets, even if they did not change since the last export.
+
+    Returns
+    -------
+    dict
+        The number of `exported` and `skipped` datasets.
+    """
+    os.makedirs( outdir, exist_ok = True )
+    subsets = subsets or {}
+    settings = dict( DEFAULT_SETTINGS, **( settings or {} ) )
+
+    manifest = _read_manifest( outdir )
+    index = indexes.of( collection )
+    exported, skipped = 0, 0
+
+    with ProcessPoolExecutor( max_workers = workers ) as pool:
+        futures = {}
+        for ecotype in index.ecotypes():
+            for celltype in index.celltypes( ecotype ):
+                df = index.dataset( ecotype, celltype ).df
+                thresholds = dataset_thresholds( df, settings, x_threshold, y_threshold, n_per_subset )
+                entry = f"{ecotype}\t{celltype}"
+                fingerprint = stable_hash( dict( version = EXPORT_VERSION, data = _data_hash( df ), subsets = subsets, settings = settings, thresholds = thresholds ) )
+                
+                if not force and manifest.get( entry, {} ).get( "fingerprint" ) == fingerprint and all( os.path.exists( os.path.join( outdir, i ) ) for i in manifest[entry]["files"] ):
+                    skipped += 1
+                    continue
+
+                future = pool.submit( _export_dataset, df, ecotype, celltype, subsets, settings, thresholds, outdir )
+                futures[future] = ( entry, fingerprint )
+
+        for future in as_completed( futures ):
+            entry, fingerprint = futures[future]
+            manifest[entry] = dict( fingerprint = fingerprint, files = future.result() )
+            exported += 1
+            _write_manifest( outdir, manifest )
+
+    return dict( exported = exported, skipped = skipped )
+
+
+def _export_dataset( df, ecotype, celltype, subsets, settings, thresholds, outdir ):
+    """
+    Export the figures and tables of a single dataset (in a worker process).
+
+    Returns
+    -------
+    list
+        The names of the written files.
+    """
+    collection = store.FrozenCollection( { ecotype : df }, key = f"export:{ecotype}\t{celltype}" )
+    dataset = indexes.Dataset( collection, ecotype, celltype, np.arange( len( df ) ), shared = False )
+    basename = safe_filename( f"{ecotype}_{celltype}" )
+
+    files = []
+    for suffix, obj in dataset_files( dataset, subsets, settings, thresholds ):
+        if isinstance( obj, pd.DataFrame ):
+            files.append( _write_table( obj, outdir, f"{basename}{suffix}.tsv" ) )
+        else:
+            files.append( _write_figure( obj, settings["backend"], outdir, f"{basename}{suffix}" ) )
+    return files
+
+
+def dataset_files( dataset, subsets, settings, thresholds ):
+    """
+    Build the tables and figures of a dataset, one after another.
+
+    Yields
+    ------
+    tuple
+        The suffix of the file name (without extension) and the table (a DataFrame) or figure.
+    """
+    import figures
+
+    yield "", dataset.df
+    yield ".subsets", figures.subsets_figure( dataset, subsets, settings, thresholds )
+
+    fig, table = figures.fractions_figure( dataset, subsets, settings, thresholds )
+    yield ".fractions", fig
+    yield ".fractions", table
+
+    fig, table = figures.topmost_figure( dataset, subsets, settings, thresholds )
+    yield ".topmost", fig
+    yield ".topmost", table
+
+
+def safe_filename( name ):
+    """
+    Replace characters that are not safe in file names.
+    """
+    return re.sub( r"[^\w.+-]+", "_", str( name ) )
+
+
+def dataset_thresholds( df, settings, x_threshold, y_threshold, n_per_subset ):
+    """
+    Get the thresholds of a dataset in the format of `gene_set_explorer.topmost_thresholds`.
+    """
+    x, y = settings["x"], settings["y"]
+    topx = x_threshold if x_threshold is not None else 0.65 * float( df[x].max() )
+    topy = y_threshold if y_threshold is not None else 0.65 * float( df[y].max() )
+    return ( topx, topy, n_per_subset, True )
+
+
+def _data_hash( df ):
+    """
+    Compute a hash of a DataFrame's contents.
+    """
+    return content_hash( pd.util.hash_pandas_object( df, index = False ).values.tobytes() )
+
+
+def _write_table( df, outdir, filename ):
+    df.to_csv( os.path.join( outdir, filename ), index = False, sep = "\t" )
+    return filename
+
+
+def _write_figure( fig, backend, outdir, filename ):
+    if backend == "plotly":
+        filename = f"{filename}.html"
+        fig.write_html( os.path.join( outdir, filename ), include_plotlyjs = "cdn" )
+    else:
+        import eco_helper.enrich.visualise as visualise
+        filename = f"{filename}.png"
+        fig.savefig( os.path.join( outdir, filename ), dpi = 200, bbox_inches = "tight" )
+        visualise.plt.close( fig )
+    return filename
+
+
+def _read_manifest( outdir ):
+    path = os.path.join( outdir, MANIFEST )
+    if not os.path.exists( path ):
+        return {}
+    with open( path ) as f:
+        return json.load( f )
+
+
+def _write_manifest( outdir, manifest ):
+    path = os.path.join( outdir, MANIFEST )
+    with open( f"{path}.tmp", "w" ) as f:
+        json.dump( manifest, f, indent = 4 )
+    os.replace( f"{path}.tmp", path )
+
+
+def main():
+    parser = argparse.ArgumentParser( description = "Export the figures and tables of every EcoType and celltype/state of a collection." )
+    parser.add_argument( "collection", help = "The pickle or columnar file of the collection." )
+    parser.add_argument( "outdir", help = "The directory to write the figures and tables to." )
+    parser.add_argument( "--subsets", help = "A json file of subset labels and their patterns (as downloaded from the viewer)." )
+    parser.add_argument( "--settings", help = "A json file of figure settings, overriding the defaults of the viewer." )
+    parser.add_argument( "--x-threshold", type = float, default = None, help = "The topmost x-threshold. By default 65%% of each dataset's maximum." )
+    parser.add_argument( "--y-threshold", type = float, default = None, help = "The topmost y-threshold. By default 65%% of each dataset's maximum." )
+    parser.add_argument( "--n-per-subset", type = int, default = 0, help = "Show the n topmost terms per subset instead of thresholding." )
+    parser.add_argument( "--workers", type = int, default = None, help = "The number of worker processes. By default one per CPU." )
+    parser.add_argument( "--force", action = "store_true", help = "Export all datasets, even if they did not change since the last export." )
+    args = parser.parse_args()
+
+    subsets, settings = None, None
+    if args.subsets:
+        with open( args.subsets ) as f:
+            subsets, errors = patterns.parse_subsets( f.read() )
+        if errors:
+            parser.error( "\n".join( errors ) )
+    if args.settings:
+        with open( args.settings ) as f:
+            settings = json.load( f )
+
+    collection = store.open_collection( args.collection )
+    result = export_collection( collection, args.outdir, subsets, settings, args.x_threshold, args.y_threshold, args.n_per_subset, args.workers, args.force )
+    print( f"Exported {result['exported']} and skipped {result['skipped']} unchanged datasets." )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+The figures of the gene set explorer.
+
+These build the figures of a single dataset from its subsets, settings and thresholds
+without depending on the streamlit session, so they are shared by the explorer page and the batch export.
+They may be built concurrently: our own matplotlib figures are drawn on their own canvases, and
+any `visualise` plotting (which uses the global `pyplot` state) holds the `render.pyplot` lock.
+"""
+
+import pandas as pd
+import eco_helper.enrich.visualise as visualise
+import highlighting
+import render
+
+
+def subsets_figure( dataset, subsets, settings, thresholds ):
+    """
+    Plot the terms of a dataset with highlighted subsets.
+
+    Parameters
+    ----------
+    dataset : indexes.Dataset
+        The dataset to plot.
+    subsets : dict
+        The subset labels and their patterns.
+    settings : dict
+        The gene set and figure settings.
+    thresholds : tuple
+        The x- and y-thresholds, the number of terms per subset, and whether to show the thresholds.
+
+    Returns
+    -------
+    plotly.graph_objects.Figure or matplotlib.figure.Figure
+        The figure.
+    """
+    settings = dict( settings )
+    x_threshold, y_threshold, _, show_thresholds = thresholds
+
+    title = dataset.celltype
+    ref_col = settings.get("ref")
+
+    despine = settings.pop("despine", False)
+    palette = settings.pop("palette", None)
+
+    backend = settings.pop("backend")
+
+    plotter = highlighting.plotter( dataset, ref_col, subsets,
+                                            x = settings.get("x"), 
+                                            y = settings.get("y"), 
+                                            hue = settings.get("hue"), 
+                                            style = settings.get("style") )
+    
+    with render.pyplot:
+        visualise.backend = backend
+        if backend == "plotly":
+            fig = plotter.highlight( 
+                                        ref_col = ref_col,
+                                        title = title,
+                                        subsets = subsets, 
+                                        hover_data = {"Combined Score" : "Combined Score", "Term" : "Term", },
+                                        xlabel = settings.get("xlabel", None),
+                                        ylabel = settings.get("ylabel", None),
+                                    )
+            if show_thresholds:
+                fig = _add_thresholds_to_plotly_fig( fig, x_threshold, y_threshold )
+        else:
+            fig = plotter.highlight( 
+                                        ref_col = ref_col,
+                                        title = title,
+                                        subsets = subsets, 
+                                        figsize = settings.get("figsize"),
+                                        palette = palette,
+                                        xlabel = settings.get("xlabel", None),
+                                        ylabel = settings.get("ylabel", None),
+                                    )
+            if despine:
+                visualise.sns.despine( fig = fig )
+            if show_thresholds:
+                fig = _add_thresholds_to_matplotlib_fig( fig, x_threshold, y_threshold )
+            fig.tight_layout()
+    return fig
+
+
+def fractions_figure( dataset, subsets, settings, thresholds ):
+    """
+    Plot the fractions of terms in each subset, among all and among the topmost terms of a dataset.
+
+    Parameters
+    ----------
+    dataset : indexes.Dataset
+        The dataset to plot.
+    subsets : dict
+        The subset labels and their patterns.
+    settings : dict
+        The gene set and figure settings.
+    thresholds : tuple
+        The x- and y-thresholds (any further entries are ignored).
+
+    Returns
+    -------
+    tuple
+        The figure and the table of fractions.
+    """
+    settings = dict( settings )
+    ref_col = settings.get("ref")
+
+    despine = settings.pop("despine", False)
+    palette = settings.pop("palette", None)
+
+    backend = settings.pop("backend")
+
+    full = highlighting.highlighted( dataset, ref_col, subsets, x = settings.get("x"), y = settings.get("y") )
+    topmost = highlighting.topmost( dataset, full, settings.get("x"), settings.get("y"), thresholds[0], thresholds[1] )
+
+    full = full.value_counts( "__hue__", normalize = True ).rename("count").reset_index()
+    full["scale"] = "among all terms"
+
+    topmost = topmost.value_counts( "__hue__", normalize = True ).rename("count").reset_index()
+    topmost["scale"] = "among topmost terms"
+
+    df = pd.concat( [full, topmost], axis = 0 )
+
+    if backend == "plotly":
+        fig = _plotly_histogram( df )
+    else:
+        fig = _matplotlib_histogram( df, palette )
+        fig.set_size_inches( settings.get("figsize"), forward=True )
+        if despine:
+            visualise.sns.despine( fig = fig )
+        fig.tight_layout()
+    return fig, df
+
+
+def topmost_figure( dataset, subsets, settings, thresholds ):
+    """
+    Plot the topmost enriched terms of a dataset (either globally or per subset).
+
+    Parameters
+    ----------
+    dataset : indexes.Dataset
+        The dataset to plot.
+    subsets : dict
+        The subset labels and their patterns.
+    settings : dict
+        The gene set and figure settings.
+    thresholds : tuple
+        The x- and y-thresholds and the number of terms per subset (`0` to use the thresholds instead).
+
+    Returns
+    -------
+    tuple
+        The figure and the table of topmost terms.
+    """
+    title = "Topmost enriched Terms"
+    ref_col = settings.get("ref")
+
+    topx, topy, n_topmost = thresholds[:3]
+    n_topmost = int(n_topmost) if n_topmost > 0 else None 
+
+    backend = settings.get("backend")
+
+    plotter = highlighting.plotter( dataset, ref_col, subsets, x = settings.get("x"), y = settings.get("y"), hue = settings.get("hue"), style = settings.get("style") )
+
+    with render.pyplot:
+        visualise.backend = backend
+        visualise.sns.set_palette( settings.get("palette") )
+        fig = plotter.top_gene_sets( subsets = subsets, ref_col = ref_col, n = n_topmost, x_threshold = topx, y_threshold = topy, title = title, xlabel = settings.get("xlabel") )
+    
+        if backend != "plotly":
+            fig.set_size_inches( settings.get("figsize"), forward=True )
+            fig.tight_layout()
+            if settings.get("despine"):
+                for axis in ['top','bottom','left','right']:
+                    fig.get_axes()[0].spines[axis].set_linewidth(0.3)
+    return fig, plotter.df
+
+
+def _add_thresholds_to_plotly_fig( fig, x, y ):
+    """
+    Add thresholds to a plotly figure.
+    """
+    fig.add_hline( y = y, line_width = 1, line_dash = "dash", line_color = "black" )
+    fig.add_vline( x = x, line_width = 1, line_dash = "dash", line_color = "black" )
+
+    return fig
+
+def _add_thresholds_to_matplotlib_fig( fig, x, y ):
+    """
+    Add thresholds to a matplotlib figure.
+    """
+    ax = fig.axes[0]
+    ax.axhline( y = y, color = "black", linestyle = "--", linewidth = 0.5 )
+    ax.axvline( x = x, color = "black", linestyle = "--", linewidth = 0.5 )
+
+    return fig
+
+def _plotly_histogram( df ):
+    """
+    Plot a histogram using plotly.
+    """
+    import plotly.express as px
+
+    fig = px.bar( df, y = "__hue__", x = "count", color = "scale", barmode = "group", title = "Prevalence of highlighted subsets" )
+    fig.update_layout( xaxis_title = "Fraction", yaxis_title = "" )
+    return fig
+
+def _matplotlib_histogram( df, palette = None ):
+    """
+    Plot a histogram using matplotlib (on its own canvas, without `pyplot`).
+    """
+    from matplotlib.figure import Figure
+
+    fig = Figure()
+    ax = fig.subplots()
+    visualise.sns.barplot( data = df, y = "__hue__", x = "count", hue = "scale", palette = palette, ax = ax )
+    ax.set( title = "Prevalence of highlighted subsets", xlabel = "Fraction", ylabel = "" )
+    ax.legend( bbox_to_anchor = (1.05, 1), loc = 2, frameon = False, title = "" )
+    return fig
@@ -5,9 +5,14 @@ Controls for the celltype/state gene set explore page.
 import streamlit as st
 from wrappers import sessionize
 import core
-import eco_helper.enrich.visualise as visualise
-import pandas as pd
-import plotly.express as px
+import controls
+import highlighting
+import render
+import instrument
+import figures
+import patterns
+import archive
+import tables
 
 import json
 
@@ -31,22 +36,19 @@ def show_subset_figures(container = st):
 def select_dataset(container = st):
     """
     Select a dataset.
+
+    Returns
+    -------
+    indexes.Dataset
+        The selected celltype/state of an EcoType.
     """
     collection = core.get( "collection" )
     if not collection:
         return 
-    ecotypes = list( collection.keys() )
-    ecotype = container.selectbox( "EcoType", options = ecotypes )
-
-    datasets = list( collection[ecotype]["CellType"].unique() )
-    dataset = container.selectbox( "Celltype/state", options = datasets )
-    
-    dataset = collection[ecotype].query( f"CellType == '{dataset}'" )
-    dataset._ecotype = ecotype
-    dataset._celltype = dataset.CellType.unique()[0]
-
-    # dataset["Genes"] = dataset["Genes"].apply( lambda x: x[:50]+"..." )
-    return dataset
+    index = core.get( "collection_index" )
+    ecotype = container.selectbox( "EcoType", options = index.ecotypes() )
+    dataset = container.selectbox( "Celltype/state", options = index.celltypes( ecotype ) )
+    return index.dataset( ecotype, dataset )
 
 @sessionize(label = "gene_set_settings")
 def figure_settings(container = st):
@@ -56,7 +58,7 @@ def figure_settings(container = st):
     col1, col2 = container.columns(2)
 
     dataset = core.get( "gene_set" )
-    datacols = dataset.columns
+    datacols = dataset.df.columns
     
     rcols = list(datacols)
     rcols.remove( "Term" )
@@ -80,21 +82,23 @@ def figure_settings(container = st):
     size = col1.selectbox( "Size", options = stylecols, help = "The column to use for the marker-size" )
     return dict( x = x, y = y, style = style, size = size, ref = ref_col )
 
+@instrument.timed
 def subsets_textfield(container = st):
     subsets = container.text_area( "Highlighted subsets", value = str( json.dumps( session.get( "highlight_subsets", {} ), indent = 4 ) ), help = "The currently highlighted term-subsets. The subsets can be edited in this field and saved." )
     save = container.button( "Save", help = "Save the field contents as subsets." )
 
     filename = core.get( "gene_set" )
-    filename = f"{filename._ecotype}_{filename._celltype}.subsets.json"
+    filename = f"{filename.ecotype}_{filename.celltype}.subsets.json"
 
     download = container.download_button( "Download", subsets, mime = "text/json", file_name = filename, help = "Download the field contents as a file." )
     if save:
-        subsets = json.loads( subsets )
-        for i in subsets: 
-            if subsets[i] is None:
-                subsets.pop(i)
-        session["highlight_subsets"] = subsets
+        subsets, errors = patterns.parse_subsets( subsets )
+        for error in errors:
+            container.error( error )
+        if subsets is not None:
+            session["highlight_subsets"] = subsets
     
+@instrument.timed
 def edit_subsets(container = st):
     """
     Edit the highlighted subsets.
@@ -113,25 +117,24 @@ def edit_subsets(container = st):
 
     label = container.selectbox( "Subset", options = labels, help = "The subset to edit." )
     
-    terms = container.text_area( "Patterns to highlight", value = subsets.get(label, ""), help = "Either a single or multiple of `python`-style `regex` patterns to match. This field is interpreted as `python-code`, hence each pattern should be encapsulated by single or double ticks. If multiple patterns are provided, they must be in a `list` or `tuple`. " )
+    terms = container.text_area( "Patterns to highlight", value = subsets.get(label, ""), help = "Either a single or multiple of `python`-style `regex` patterns to match. Each pattern should be encapsulated by single or double ticks (a single pattern may also be entered without). If multiple patterns are provided, they must be in a `list` or `tuple`. " )
     # multiple_terms = container.checkbox( "contains multiple patterns", help = "If `True`, the terms will be interpreted as a `list` or `tuple` of patterns. If `False`, the terms will be interpreted as a single pattern." )
-    try:
-        terms = eval( terms.strip() ) #if multiple_terms else [terms.strip()]
-    except:
-        terms = [terms.strip()]
-        if terms == [""]:
-            terms = None
+    terms, errors = patterns.parse_patterns( terms )
+    for error in errors:
+        container.error( error )
 
 
     new_label = container.text_input( "New subset label", value = label, placeholder = "New subset", help = "The label of the new subset. This may include spaces and special characters." )
     add_new = container.button( "Save subset", help = "Save the subset to the current selection" )
     drop_subset = container.button( "Drop subset", help = "Drop the subset from the current selection" )
-    if add_new:
+    if drop_subset:
+        subsets.pop( label, None )
+    elif errors:
+        pass
+    elif add_new:
         subsets[new_label] = terms
         if not new_label == "None":
             subsets.pop( "None", None )
-    elif drop_subset:
-        subsets.pop( label, None )
     elif terms:
         subsets[label] = terms
     else:
@@ -146,11 +149,12 @@ def upload_subsets(container = st):
     file = container.file_uploader( "Upload a subset file", help = "Upload a file of subsets to highlight. This must be a python `dictionary` as a blank text file (i.e. a `json` file), containing subset labels as keys and lists of python-`regex` patterns as values (lists of strings)." )
     load = container.button( "Load subset file", help = "Load the subset file." )
     
-    contents = file.read().decode("utf-8") if file else None
+    if not ( load and file ):
+        return
+    contents, errors = patterns.parse_subsets( file.getvalue().decode("utf-8") )
+    for error in errors:
+        container.error( error )
     if contents:
-        contents = eval( contents )
-    
-    if load and contents:
         session["highlight_subsets"].update( contents ) 
 
 @sessionize
@@ -164,8 +168,8 @@ def topmost_thresholds(container = st):
     dataset = core.get( "gene_set" )
     x = core.get( "gene_set_settings" )["x"]
     y = core.get( "gene_set_settings" )["y"]
-    minx, maxx = float(dataset[x].min()), float(dataset[x].max())
-    miny, maxy = float(dataset[y].min()), float(dataset[y].max())
+    minx, maxx = dataset.range( x )
+    miny, maxy = dataset.range( y )
     topx = col1.slider( "x-threshold", min_value = minx, max_value = maxx, value = 0.65 * maxx, step = 0.01, help = "The topmost threshold for the `x` column." )
     topy = col2.slider( "y-threshold", min_value = miny, max_value = maxy, value = 0.65 * maxy, step = 0.01, help = "The topmost threshold for the `y` column." )
     n_per_subset = col3.number_input( "Show n per subset", min_value = 0, value = 0, max_value = 50, help = "Use this to show the `n` top-most gene sets in each subset instead of global numeric thresholding. If set to `0` this input is ignored." )
@@ -173,124 +177,67 @@ def topmost_thresholds(container = st):
 
     return topx, topy, n_per_subset, show_thresholds
 
-# @sessionize(label = "raw_figure")
-def view_subsets(container = st):
+def subsets_job():
     """
-    View the current subsets.
+    The render job of the subsets scatterplot (see `render.concurrently`).
     """
-
     dataset = core.get( "gene_set" )
     subsets = session["highlight_subsets"]
     
-    x_threshold, y_threshold, _, show_thresholds = core.get( "topmost_thresholds" )
-    settings = core.get( "gene_set_settings" )
+    thresholds = core.get( "topmost_thresholds" )
+    settings = dict( core.get( "gene_set_settings" ) )
     settings.update( core.get( "figure_settings" ) )
 
-    title = dataset["CellType"].unique()[0]
-    ref_col = settings.get("ref")
+    key = dict( figure = "subsets", dataset = dataset.key, subsets = subsets, thresholds = ( thresholds[0], thresholds[1], thresholds[3] ), settings = settings )
+    return key, lambda: figures.subsets_figure( dataset, subsets, settings, thresholds ), settings["backend"]
 
-    despine = settings.pop("despine", False)
-    padding = settings.pop("padding", None)
-    palette = settings.pop("palette", None)
+# @sessionize(label = "raw_figure")
+@instrument.timed
+def view_subsets(container = st, rendered = None):
+    """
+    View the current subsets.
 
-    visualise.backend = settings.pop("backend")
+    If the figure was already rendered (e.g. concurrently with the other figures), it is only shown.
+    """
+    dataset = core.get( "gene_set" )
+    if rendered is None:
+        rendered = render.rendered( *subsets_job() )
+    rendered.show( container )
 
-    plotter = visualise.StateScatterplot(   df = dataset, 
-                                            x = settings.get("x"), 
-                                            y = settings.get("y"), 
-                                            hue = settings.get("hue"), 
-                                            style = settings.get("style") )
-    
-    if visualise.backend == "plotly":
-        fig = plotter.highlight( 
-                                    ref_col = ref_col,
-                                    title = title,
-                                    subsets = subsets, 
-                                    hover_data = {"Combined Score" : "Combined Score", "Term" : "Term", },
-                                    xlabel = settings.get("xlabel", None),
-                                    ylabel = settings.get("ylabel", None),
-                                )
-        if show_thresholds:
-            fig = _add_thresholds_to_plotly_fig( fig, x_threshold, y_threshold )
-        container.plotly_chart( fig, use_container_width = True )
-    else:
-        fig = plotter.highlight( 
-                                    ref_col = ref_col,
-                                    title = title,
-                                    subsets = subsets, 
-                                    figsize = settings.get("figsize"),
-                                    palette = palette,
-                                    xlabel = settings.get("xlabel", None),
-                                    ylabel = settings.get("ylabel", None),
-                                )
-        if despine:
-            visualise.sns.despine()
-        if show_thresholds:
-            fig = _add_thresholds_to_matplotlib_fig( fig, x_threshold, y_threshold )
-        visualise.plt.tight_layout()
-        container.pyplot( fig )
-
-    container.download_button( "Download table", dataset.to_csv(index=False, sep="\t"), file_name = f"{dataset._ecotype}_{dataset._celltype}.tsv", help = "Download the data as a tsv file.", key = "download_table", mime = "text/tsv" )
-    return fig 
-
-def view_histogram(container = st):
+    controls.download( "Download table", ( dataset.key, "tsv" ), lambda: dataset.df.to_csv(index=False, sep="\t"), f"{dataset.ecotype}_{dataset.celltype}.tsv", "text/tsv", container, help = "Download the data as a tsv file." )
+    return rendered
 
+def fractions_job():
+    """
+    The render job of the subset fractions (see `render.concurrently`).
+    """
     dataset = core.get( "gene_set" )
     subsets = session["highlight_subsets"]
     
-
-    settings = core.get( "gene_set_settings" )
+    settings = dict( core.get( "gene_set_settings" ) )
     settings.update( core.get( "figure_settings" ) )
     thresholds = core.get( "topmost_thresholds" )
 
-    title = "Term Counts per Subset" #dataset["CellType"].unique()[0]
-    ref_col = settings.get("ref")
+    key = dict( figure = "fractions", dataset = dataset.key, subsets = subsets, thresholds = thresholds[:2], settings = settings )
+    return key, lambda: figures.fractions_figure( dataset, subsets, settings, thresholds ), settings["backend"]
 
-    despine = settings.pop("despine", False)
-    padding = settings.pop("padding", None)
-    palette = settings.pop("palette", None)
+@instrument.timed
+def view_histogram(container = st, rendered = None):
+    """
+    View the fractions of terms in each subset.
 
-    backend = settings.pop("backend")
+    If the figure was already rendered (e.g. concurrently with the other figures), it is only shown.
+    """
+    dataset = core.get( "gene_set" )
+    if rendered is None:
+        rendered = render.rendered( *fractions_job() )
+    rendered.show( container )
 
-    
-    plotter = visualise.StateScatterplot(   df = dataset, 
-                                            x = settings.get("x"), 
-                                            y = settings.get("y"), 
-                                            hue = settings.get("hue"), 
-                                            style = settings.get("style") )
-    plotter._highlight( ref_col = ref_col, subsets = subsets )
-    full = plotter.df
-    full = full.value_counts( "__hue__", normalize = True ).rename("count").reset_index()
-    full["scale"] = "among all terms"
-
-    topmost = dataset.query( f"{settings.get('x')} > {thresholds[0]} and {settings.get('y')} > {thresholds[1]}" )
-    plotter = visualise.StateScatterplot(   df = topmost, 
-                                            x = settings.get("x"), 
-                                            y = settings.get("y"), 
-                                            hue = settings.get("hue"), 
-                                            style = settings.get("style") )
-    plotter._highlight( ref_col = ref_col, subsets = subsets )
-    topmost = plotter.df
-    topmost = topmost.value_counts( "__hue__", normalize = True ).rename("count").reset_index()
-    topmost["scale"] = "among topmost terms"
-
-    df = pd.concat( [full, topmost], axis = 0 )
-
-    if backend == "plotly":
-        fig = _plotly_histogram( df )
-        container.plotly_chart( fig, use_container_width = True )
-    else:
-        visualise.sns.set_palette( palette )
-        fig = _matplotlib_histogram( df )
-        fig.set_size_inches( settings.get("figsize"), forward=True )
-        if despine:
-            visualise.sns.despine()
-        visualise.plt.tight_layout()
-        container.pyplot( fig )
-    download = container.download_button( "Download table", df.to_csv( index = False, sep = "\t" ), file_name = f"{dataset._ecotype}_{dataset._celltype}.fractions.tsv", help = "Download the data as a tsv file.", key = "download_table", mime = "text/tsv" )
-    return fig 
+    controls.download( "Download table", ( rendered.key, "tsv" ), lambda: rendered.data.to_csv( index = False, sep = "\t" ), f"{dataset.ecotype}_{dataset.celltype}.fractions.tsv", "text/tsv", container, help = "Download the data as a tsv file." )
+    return rendered
 
 
+@instrument.timed
 def auto_drop_subsets(container = st):
     """
     Drop automatically any subsets that do not have any terms in the topmost.
@@ -307,16 +254,8 @@ def auto_drop_subsets(container = st):
 
     thresholds = core.get( "topmost_thresholds" )
 
-    cropped = dataset.query( f"`{settings.get('x')}` > {thresholds[0]} and `{settings.get('y')}` > {thresholds[1]}" )
-
-    plotter = visualise.StateScatterplot(   df = cropped, 
-                                            x = settings.get("x"), 
-                                            y = settings.get("y"), 
-                                            hue = settings.get("hue"), 
-                                            style = settings.get("style") )
-    
-    plotter._highlight( settings.get("ref"), subsets )
-    cropped = plotter.df
+    cropped = highlighting.highlighted( dataset, settings.get("ref"), subsets, x = settings.get("x"), y = settings.get("y") )
+    cropped = highlighting.topmost( dataset, cropped, settings.get("x"), settings.get("y"), thresholds[0], thresholds[1] )
     # st.write( cropped )
 
     counts = cropped.value_counts( "__hue__" )
@@ -332,79 +271,68 @@ def auto_drop_subsets(container = st):
 
 
     
-# @sessionize(label="topmost_terms")
-def view_gene_sets(container = st):
-
+def topmost_job():
+    """
+    The render job of the topmost terms (see `render.concurrently`).
+    """
     dataset = core.get( "gene_set" )
     subsets = session["highlight_subsets"]
 
-    settings = core.get( "gene_set_settings" )
+    settings = dict( core.get( "gene_set_settings" ) )
     settings.update( core.get( "figure_settings" ) )
 
-    title = "Topmost enriched Terms"
-    ref_col = settings.get("ref")
-
-    topx, topy, n_topmost, _ = core.get( "topmost_thresholds" )
-    n_topmost = int(n_topmost) if n_topmost > 0 else None 
+    thresholds = core.get( "topmost_thresholds" )
 
-    visualise.backend = settings.get("backend")
+    key = dict( figure = "topmost", dataset = dataset.key, subsets = subsets, thresholds = thresholds[:3], settings = settings )
+    return key, lambda: figures.topmost_figure( dataset, subsets, settings, thresholds ), settings["backend"]
 
-    visualise.sns.set_palette( settings.get("palette") )
-    plotter = visualise.StateScatterplot(   df = dataset, x = settings.get("x"), y = settings.get("y"), hue = settings.get("hue"), style = settings.get("style") )
-    fig = plotter.top_gene_sets( subsets = subsets, ref_col = ref_col, n = n_topmost, x_threshold = topx, y_threshold = topy, title = title, xlabel = settings.get("xlabel") )
-    
-    if visualise.backend == "plotly":
-        container.plotly_chart( fig, use_container_width = True )
-    else:
-        fig.set_size_inches( settings.get("figsize"), forward=True )
-        visualise.plt.tight_layout()
-        if settings.get("despine"):
-            for axis in ['top','bottom','left','right']:
-                fig.get_axes()[0].spines[axis].set_linewidth(0.3)
-
-        container.pyplot( fig )
+# @sessionize(label="topmost_terms")
+@instrument.timed
+def view_gene_sets(container = st, rendered = None):
+    """
+    View the topmost terms.
 
+    If the figure was already rendered (e.g. concurrently with the other figures), it is only shown.
+    """
+    dataset = core.get( "gene_set" )
+    if rendered is None:
+        rendered = render.rendered( *topmost_job() )
+    rendered.show( container )
 
     if core.get( "which_subsets" ).get( "topmost_table" ):
         table_ext = container.expander( "Gene set table", expanded = False )
-        table_ext.table(plotter.df)
-    download = container.download_button( "Download table", dataset.to_csv( index = False, sep = "\t" ), file_name = f"{dataset._ecotype}_{dataset._celltype}.topmost.tsv", mime = "text/tsv" )
+        tables.paged_table( table_ext, rendered.data, rendered.key, name = "gene_set_table" )
+    controls.download( "Download table", ( dataset.key, "tsv" ), lambda: dataset.df.to_csv( index = False, sep = "\t" ), f"{dataset.ecotype}_{dataset.celltype}.topmost.tsv", "text/tsv", container )
 
-    return fig
+    return rendered
 
-def _add_thresholds_to_plotly_fig( fig, x, y ):
+@instrument.timed
+def download_everything(container = st):
     """
-    Add thresholds to a plotly figure.
-    """
-    fig.add_hline( y = y, line_width = 1, line_dash = "dash", line_color = "black" )
-    fig.add_vline( x = x, line_width = 1, line_dash = "dash", line_color = "black" )
-
-    return fig
+    Download an archive of the tables (and figures) of all EcoTypes and celltypes/states.
 
-def _add_thresholds_to_matplotlib_fig( fig, x, y ):
+    The archive is written in the background (see `archive`), so it can be downloaded on a later rerun once it is ready.
     """
-    Add thresholds to a matplotlib figure.
-    """
-    ax = fig.axes[0]
-    ax.axhline( y = y, color = "black", linestyle = "--", linewidth = 0.5 )
-    ax.axvline( x = x, color = "black", linestyle = "--", linewidth = 0.5 )
-
-    return fig
+    collection = core.get( "collection" )
+    col1, col2 = container.columns(2)
+    table_format = col1.radio( "Table format", options = list( archive.FORMATS ), help = "The format of the tables in the archive." )
+    with_figures = col2.checkbox( "Include figures", value = True, help = "Also add the scatterplot, fractions and topmost figures (and their tables) of each celltype/state, using the current subsets and settings and the default thresholds (65% of each dataset's maximum)." )
 
-def _plotly_histogram( df ):
-    """
-    Plot a histogram using plotly.
-    """
-    fig = px.bar( df, y = "__hue__", x = "count", color = "scale", barmode = "group", title = "Prevalence of highlighted subsets" )
-    fig.update_layout( xaxis_title = "Fraction", yaxis_title = "" )
-    return fig
+    if container.button( "Prepare archive", help = "Start writing the archive of all EcoTypes and celltypes/states in the background." ):
+        settings = dict( core.get( "gene_set_settings" ) )
+        settings.update( core.get( "figure_settings" ) )
+        n_per_subset = core.get( "topmost_thresholds" )[2]
+        session["archive"] = archive.start( collection, core.get( "highlight_subsets" ), settings, table_format, with_figures, n_per_subset )
 
-def _matplotlib_histogram( df ):
-    """
-    Plot a histogram using matplotlib.
-    """
-    fig, ax = visualise.plt.subplots()
-    visualise.sns.barplot( data = df, y = "__hue__", x = "count", hue = "scale", ax = ax )
-    ax.set( title = "Prevalence of highlighted subsets", xlabel = "Fraction", ylabel = "" )
-    ax.legend( bbox_to_anchor = (1.05, 1), loc = 2, frameon = False, title = "" )
-    return fig
\ No newline at end of file
+    current = core.get( "archive" )
+    if current is None:
+        return
+    if current.failed:
+        container.error( f"The archive could not be written: {current.error or 'its file was removed.'}" )
+    elif not current.ready:
+        container.progress( int( 100 * current.progress ) )
+        container.caption( current.message )
+        container.button( "Refresh", help = "Check the progress of the archive." )
+    else:
+        with current.open() as f:
+            container.download_button( "Download archive", f, file_name = "eco_helper_viewer.zip", mime = "application/zip", key = "download_archive" )
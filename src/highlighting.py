@@ -0,0 +1,101 @@
+"""
+Memoized highlighting of term-subsets.
+
+Highlighting assigns each term of a dataset the label of the subset whose patterns it matches (stored in the
+`__hue__` column). Since all views of the gene set explorer highlight the same dataset with the same subsets,
+the result is computed once per dataset, reference column and subsets and shared by all views (and sessions).
+The patterns themselves are only matched once per vocabulary of the reference column (see `matching`).
+"""
+
+import os
+import eco_helper.enrich.visualise as visualise
+import matching
+from cache import LRUCache, stable_hash
+
+MAX_CACHED_RESULTS = int( os.environ.get( "ECO_HELPER_VIEWER_CACHED_HIGHLIGHTS", 64 ) )
+
+results = LRUCache( max_entries = MAX_CACHED_RESULTS )
+
+
+def subsets_hash( subsets ):
+    """
+    Compute a stable hash of a dictionary of subsets.
+    """
+    return stable_hash( subsets )
+
+
+def highlighted( dataset, ref_col, subsets, **kwargs ):
+    """
+    Get a dataset's terms with their subset labels.
+
+    Parameters
+    ----------
+    dataset : indexes.Dataset
+        The dataset to highlight.
+    ref_col : str
+        The column to match the subsets' patterns in.
+    subsets : dict
+        The subset labels and their patterns.
+    **kwargs
+        Any additional keyword arguments (e.g. the `StateScatterplot` arguments of the caller) are ignored.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The dataset's DataFrame with an additional `__hue__` column. This is shared and must not be modified.
+        Datasets that are not shared (see `indexes.Dataset`) are highlighted without caching the result.
+    """
+    if not getattr( dataset, "shared", True ):
+        return _highlight( dataset, ref_col, subsets )
+    key = ( dataset.key, ref_col, subsets_hash( subsets ) )
+    return results.get_or_set( key, lambda: _highlight( dataset, ref_col, subsets ) )
+
+
+def topmost( dataset, df, x, y, x_threshold, y_threshold ):
+    """
+    Get the terms of a dataset's (highlighted) DataFrame above both thresholds.
+
+    This uses the dataset's sorted orderings of `x` and `y` (see `indexes.Dataset.above`) instead of scanning all terms.
+    """
+    return df.iloc[ dataset.above( x, y, x_threshold, y_threshold ) ]
+
+
+def plotter( dataset, ref_col, subsets, **kwargs ):
+    """
+    Get a `StateScatterplot` of a dataset whose subsets are already highlighted.
+
+    Parameters
+    ----------
+    dataset : indexes.Dataset
+        The dataset to plot.
+    ref_col : str
+        The column to match the subsets' patterns in.
+    subsets : dict
+        The subset labels and their patterns.
+    **kwargs
+        Any additional keyword arguments are passed to `StateScatterplot`.
+
+    Returns
+    -------
+    visualise.StateScatterplot
+        The plotter. Its own highlighting is replaced by the memoized result.
+    """
+    df = highlighted( dataset, ref_col, subsets, **kwargs ).copy()
+    plotter = visualise.StateScatterplot( df = df, **kwargs )
+
+    def _reuse_highlight( *args, **kwargs ):
+        plotter.df = df
+        return df
+
+    plotter._highlight = _reuse_highlight
+    return plotter
+
+
+def _highlight( dataset, ref_col, subsets ):
+    """
+    Highlight the subsets in a dataset's DataFrame.
+
+    The labels are matched on the vocabulary of the reference column (see `matching`), not row by row.
+    """
+    labels = matching.label_rows( dataset.collection, dataset.ecotype, dataset.positions, ref_col, subsets )
+    return dataset.df.assign( __hue__ = labels )
@@ -0,0 +1,193 @@
+"""
+Row indexes of collections.
+
+The index of a collection is built once when the collection is loaded and maps each
+(EcoType, celltype/state) pair to the row positions of its terms, so that selecting a dataset
+does not need to scan the `CellType` column again.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+import store
+import normalize
+from cache import LRUCache
+
+MAX_CACHED_DATASETS = int( os.environ.get( "ECO_HELPER_VIEWER_CACHED_DATASETS", 32 ) )
+
+
+class Dataset:
+    """
+    The terms of a single celltype/state in an EcoType.
+
+    Parameters
+    ----------
+    collection : FrozenCollection or columnar.LazyCollection
+        The collection the dataset belongs to.
+    ecotype : str
+        The EcoType of the dataset.
+    celltype : str
+        The celltype/state of the dataset.
+    positions : np.ndarray
+        The row positions of the dataset within the EcoType's DataFrame.
+    shared : bool
+        If `True`, results derived from the dataset (e.g. its highlighting) are cached for all views and sessions.
+        Datasets that are only used once (e.g. when exporting all datasets) should not fill the shared caches.
+    """
+    def __init__( self, collection, ecotype, celltype, positions, shared = True ):
+        self.collection = collection
+        self.ecotype = ecotype
+        self.celltype = celltype
+        self.positions = positions
+        self.shared = shared
+        self._df = None
+        self._sorted = {}
+
+    def __len__( self ):
+        return len( self.positions )
+
+    def __repr__( self ):
+        return f"Dataset({self.ecotype!r}, {self.celltype!r}, n={len(self)})"
+
+    @property
+    def key( self ):
+        """
+        A key that identifies the dataset across sessions.
+        """
+        return ( self.collection.key, self.ecotype, self.celltype )
+
+    @property
+    def df( self ):
+        """
+        The DataFrame of the dataset's terms.
+
+        Only the dataset's own rows are read, so for columnar collections the EcoType is never converted as a whole.
+        Categorical columns only keep the categories the dataset uses.
+        """
+        if self._df is None:
+            self._df = normalize.compact( self.collection.rows( self.ecotype, self.positions ) )
+        return self._df
+
+    def sorted( self, column ):
+        """
+        The (non-missing) values of a numeric column in ascending order and the row numbers (within `df`) that sort them.
+
+        The ordering is computed once per column, so thresholding the dataset afterwards only needs binary searches.
+        """
+        if column not in self._sorted:
+            values = self.df[column].to_numpy( dtype = float )
+            order = np.argsort( values, kind = "stable" )
+            order = order[ ~np.isnan( values[order] ) ]
+            self._sorted[column] = ( values[order], order )
+        return self._sorted[column]
+
+    def range( self, column ):
+        """
+        The minimum and maximum of a numeric column.
+        """
+        values, _ = self.sorted( column )
+        if not len( values ):
+            return float( "nan" ), float( "nan" )
+        return float( values[0] ), float( values[-1] )
+
+    def above( self, x, y, x_threshold, y_threshold ):
+        """
+        The row numbers (within `df`) of the terms above both thresholds, in ascending order.
+
+        Parameters
+        ----------
+        x, y : str
+            The columns to threshold.
+        x_threshold, y_threshold : float
+            The thresholds (exclusive).
+        """
+        xvalues, xorder = self.sorted( x )
+        yvalues, yorder = self.sorted( y )
+        above_x = xorder[ np.searchsorted( xvalues, x_threshold, side = "right" ): ]
+        above_y = yorder[ np.searchsorted( yvalues, y_threshold, side = "right" ): ]
+
+        if len( above_x ) <= len( above_y ):
+            rows, other, threshold = above_x, y, y_threshold
+        else:
+            rows, other, threshold = above_y, x, x_threshold
+        rows = rows[ self.df[other].to_numpy( dtype = float )[rows] > threshold ]
+        return np.sort( rows )
+
+
+class CollectionIndex:
+    """
+    The row positions of each (EcoType, celltype/state) pair in a collection.
+
+    Parameters
+    ----------
+    collection : FrozenCollection or columnar.LazyCollection
+        The collection to index.
+    progress : callable
+        A function that is called with the fraction of indexed EcoTypes and a message.
+    """
+    def __init__( self, collection, progress = None ):
+        self.collection = collection
+        self._positions = {}
+        for ecotype in collection.keys():
+            self._positions[ecotype] = _group_positions( collection.frame( ecotype, [ "CellType" ] )["CellType"] )
+            if progress:
+                progress( len( self._positions ) / len( collection ), f"Indexed EcoType {ecotype} ({len(self._positions[ecotype])} celltypes/states)" )
+        self._datasets = LRUCache( max_entries = MAX_CACHED_DATASETS )
+
+    def __getstate__( self ):
+        # the collection and its datasets are not persisted (see `store.derive`)
+        return dict( _positions = self._positions )
+
+    def __setstate__( self, state ):
+        self.collection = None
+        self._positions = state["_positions"]
+        self._datasets = LRUCache( max_entries = MAX_CACHED_DATASETS )
+
+    def ecotypes( self ):
+        """
+        The EcoTypes of the collection.
+        """
+        return list( self._positions.keys() )
+
+    def celltypes( self, ecotype ):
+        """
+        The celltypes/states of an EcoType, in order of their first appearance.
+        """
+        return list( self._positions[ecotype].keys() )
+
+    def positions( self, ecotype, celltype ):
+        """
+        The row positions of a celltype/state within its EcoType's DataFrame.
+        """
+        return self._positions[ecotype][celltype]
+
+    def dataset( self, ecotype, celltype ):
+        """
+        Get the dataset of a celltype/state in an EcoType.
+
+        Datasets are shared, so repeated selections of the same pair return the same object.
+        """
+        return self._datasets.get_or_set( ( ecotype, celltype ), lambda: Dataset( self.collection, ecotype, celltype, self.positions( ecotype, celltype ) ) )
+
+
+def of( collection, progress = None ):
+    """
+    Get the index of a collection, building it if it does not exist yet.
+    """
+    return store.derive( collection, "index", lambda collection: CollectionIndex( collection, progress ) )
+
+
+def _group_positions( celltypes ):
+    """
+    Group the row positions of a column by its (categorical) values.
+
+    Returns
+    -------
+    dict
+        The row positions of each value, in order of first appearance.
+    """
+    categories = [ i for i in pd.unique( np.asarray( celltypes, dtype = object ) ) if pd.notna( i ) ]
+    codes = pd.Categorical( celltypes, categories = categories ).codes
+    order = np.argsort( codes, kind = "stable" )
+    bounds = np.searchsorted( codes[order], np.arange( len( categories ) + 1 ) )
+    return { category : order[ bounds[i] : bounds[i+1] ] for i, category in enumerate( categories ) }
@@ -0,0 +1,151 @@
+"""
+Timing instrumentation of reruns.
+
+Page sections and session functions record their wall time, the number of rows they processed and the
+size of the figure they produced. The records of a rerun can be shown in the sidebar and are appended
+as JSON lines to the file given by the `ECO_HELPER_VIEWER_LATENCY_LOG` environment variable.
+"""
+
+import os
+import json
+import time
+import functools
+import contextlib
+import pandas as pd
+import streamlit as st
+
+session = st.session_state
+
+LOG_FILE = os.environ.get( "ECO_HELPER_VIEWER_LATENCY_LOG" )
+
+
+def start_rerun():
+    """
+    Start recording the timings of a rerun.
+    """
+    session["_timings"] = []
+    session["_timings_depth"] = 0
+    session["_rerun_start"] = time.perf_counter()
+
+
+def finish_rerun():
+    """
+    Finish recording the timings of a rerun and append them to the latency log.
+
+    Returns
+    -------
+    dict
+        The record of the rerun.
+    """
+    timings = session.get( "_timings" )
+    if timings is None:
+        return
+    record = dict( 
+                    time = time.time(), 
+                    seconds = time.perf_counter() - session["_rerun_start"], 
+                    page = _page(), 
+                    sections = timings,
+                )
+    session["last_rerun_timings"] = record
+    if LOG_FILE:
+        with open( LOG_FILE, "a" ) as f:
+            f.write( json.dumps( record, default = str ) + "\n" )
+    return record
+
+
+@contextlib.contextmanager
+def section( name ):
+    """
+    Record the timing of a section of a rerun.
+
+    Yields
+    ------
+    dict
+        The record of the section. The `rows` and `figure_bytes` entries may be set by the caller (see `measure`).
+    """
+    timings = session.get( "_timings" )
+    record = dict( name = name, seconds = None, rows = None, figure_bytes = None )
+    if timings is None:
+        yield record
+        return
+
+    record["depth"] = session["_timings_depth"]
+    timings.append( record )
+    session["_timings_depth"] += 1
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record["seconds"] = time.perf_counter() - start
+        session["_timings_depth"] -= 1
+
+
+def measure( record, value ):
+    """
+    Record the number of rows and the size of the figure of a section's result.
+    """
+    if value is None:
+        return
+    if hasattr( value, "payload" ):
+        record["figure_bytes"] = len( value.payload )
+        value = value.data
+    if isinstance( value, pd.DataFrame ) or hasattr( value, "positions" ):
+        record["rows"] = len( value )
+
+
+def timed( func = None, label = None ):
+    """
+    Record the timing of a function as a section of the rerun.
+
+    If the label is not specified, the module and function name will be used.
+    """
+    def _wrapper( func ):
+        name = label or f"{func.__module__}.{func.__name__}"
+
+        @functools.wraps( func )
+        def wrapper( *args, **kwargs ):
+            with section( name ) as record:
+                result = func( *args, **kwargs )
+                measure( record, result )
+            return result
+
+        return wrapper
+
+    if func:
+        return _wrapper( func )
+    return _wrapper
+
+
+def panel( container = st ):
+    """
+    Show the timings of the last rerun.
+    """
+    record = session.get( "last_rerun_timings" )
+    if not record:
+        return
+    container.markdown( f"**Rerun:** {1000 * record['seconds']:.0f} ms" )
+    rows = [ 
+                {
+                    "section" : " " * i.get( "depth", 0 ) + i["name"], 
+                    "ms" : round( 1000 * i["seconds"], 1 ) if i["seconds"] is not None else None, 
+                    "rows" : i["rows"], 
+                    "figure KB" : round( i["figure_bytes"] / 1024, 1 ) if i["figure_bytes"] else None,
+                } 
+                for i in record["sections"] 
+            ]
+    container.dataframe( pd.DataFrame( rows ) )
+
+
+def _page():
+    """
+    The page shown in the current rerun.
+    """
+    if session.get( "explore_gene_sets" ):
+        return "gene_set_explorer"
+    if session.get( "search_terms" ):
+        return "term_search"
+    if session.get( "compare_collections" ):
+        return "comparison"
+    if session.get( "collection" ):
+        return "ecotype_summary"
+    return "welcome"
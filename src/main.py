@@ -7,8 +7,7 @@ loc = os.path.dirname(__file__)
 
 
 import streamlit as st
-import window, core, controls
-import gene_set_explorer as explorer
+import window, core, instrument
 
 session = st.session_state
 
@@ -24,22 +23,34 @@ def main():
         
     
 
+    instrument.start_rerun()
     window.side_controls()
 
     if not core.get( "datafile" ) and not core.get( "collection" ):
          window.welcome()
 
-    if core.get( "datafile" ) and not core.get( "collection" ):
-        core.load( session["datafile"] )
+    datafile = core.get( "datafile" )
+    if datafile and core.file_id( datafile ) != core.get( "datafile_id" ):
+        core.load( datafile )
     
     if core.get( "collection" ):
+        window.collection_memory()
 
-        if core.get( "inspect_summary" ) or (not core.get( "explore_gene_sets" ) and not core.get( "inspect_summary" )):
+        if core.get( "inspect_summary" ) or (not core.get( "explore_gene_sets" ) and not core.get( "search_terms" ) and not core.get( "compare_collections" ) and not core.get( "inspect_summary" )):
             window.ecotype_summary_page()
 
         if core.get( "explore_gene_sets" ):
             window.gene_set_explorer()
+
+        if core.get( "search_terms" ):
+            window.term_search_page()
+
+        if core.get( "compare_collections" ):
+            window.comparison_page()
             
+    instrument.finish_rerun()
+    if core.get( "show_timings" ):
+        instrument.panel( st.sidebar.expander( "Timings", True ) )
 
     # st.write(session)
 
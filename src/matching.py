@@ -0,0 +1,147 @@
+"""
+Vocabulary-level matching of term-subsets.
+
+The same terms repeat in every celltype/state of every EcoType, so instead of running each subset's patterns
+over the rows of a dataset, the patterns are compiled once and matched against the unique values (the vocabulary)
+of the reference column a single time. The labels of the rows are then looked up through their (categorical) codes.
+
+Labels follow the highlighting of `visualise.StateScatterplot`: the patterns of a subset are searched anywhere in a value,
+a value matching several subsets gets the label of the last of them, and values matching none are labelled `DEFAULT_LABEL`.
+"""
+
+import os
+import re
+import numpy as np
+import pandas as pd
+import persist
+from cache import LRUCache, content_hash, stable_hash
+
+MAX_CACHED_LABELS = int( os.environ.get( "ECO_HELPER_VIEWER_CACHED_LABELS", 64 ) )
+
+DEFAULT_LABEL = "other"
+
+labels = LRUCache( max_entries = MAX_CACHED_LABELS )
+
+# patterns that refer to their own groups or set inline flags cannot be combined with others
+_UNCOMBINABLE = re.compile( r"\\[1-9]|\(\?P=|\(\?[aiLmsux-]+[:)]" )
+
+
+class Matcher:
+    """
+    The compiled patterns of a set of subsets.
+
+    All patterns are combined into a single expression, in which each subset is an alternative
+    (in order of precedence) that marks itself through a named group. If the patterns cannot be combined
+    (because they use back-references or inline flags), each pattern is compiled on its own instead.
+
+    Parameters
+    ----------
+    subsets : dict
+        The subset labels and their patterns (a single pattern or a list of patterns).
+    """
+    def __init__( self, subsets ):
+        self.labels = []
+        patterns = []
+        for label, subset in subsets.items():
+            if not subset:
+                continue
+            self.labels.append( label )
+            patterns.append( [ subset ] if isinstance( subset, str ) else list( subset ) )
+
+        self._combined = None
+        self._each = None
+        try:
+            if any( _UNCOMBINABLE.search( i ) for subset in patterns for i in subset ):
+                raise re.error( "back-references and inline flags cannot be combined" )
+            joined = [ "|".join( f"(?:{i})" for i in subset ) for subset in patterns ]
+            # later subsets take precedence, so they are tried first
+            alternatives = [ f"(?=[\\s\\S]*?(?:{joined[i]}))(?P<_{i}>)" for i in reversed( range( len( joined ) ) ) ]
+            self._combined = re.compile( "^(?:" + "|".join( alternatives ) + ")" ) if alternatives else None
+        except re.error:
+            self._each = [ [ re.compile( i ) for i in subset ] for subset in patterns ]
+
+    def label( self, value ):
+        """
+        Get the label of a single value.
+        """
+        if not isinstance( value, str ):
+            return DEFAULT_LABEL
+        if self._each is not None:
+            for i in reversed( range( len( self._each ) ) ):
+                if any( pattern.search( value ) for pattern in self._each[i] ):
+                    return self.labels[i]
+            return DEFAULT_LABEL
+        match = self._combined.match( value ) if self._combined is not None else None
+        if match is None:
+            return DEFAULT_LABEL
+        return self.labels[ int( match.lastgroup[1:] ) ]
+
+    def match( self, vocabulary ):
+        """
+        Get the labels of all values of a vocabulary.
+
+        Returns
+        -------
+        np.ndarray
+            The label of each value (as an object array).
+        """
+        return np.array( [ self.label( i ) for i in vocabulary ], dtype = object )
+
+
+def label_rows( collection, ecotype, positions, ref_col, subsets ):
+    """
+    Get the subset labels of rows of a collection.
+
+    If the reference column is categorical, its categories are shared by all EcoTypes (see `normalize`),
+    so they are only matched once per collection and subsets, and every further dataset only looks up its rows' codes
+    (the labels of such vocabularies are also kept in the disk cache, see `persist`).
+    Otherwise the unique values of the rows are matched.
+
+    Parameters
+    ----------
+    collection : FrozenCollection or columnar.LazyCollection
+        The collection.
+    ecotype : str
+        The EcoType of the rows.
+    positions : np.ndarray
+        The row positions within the EcoType.
+    ref_col : str
+        The column to match the subsets' patterns in.
+    subsets : dict
+        The subset labels and their patterns.
+
+    Returns
+    -------
+    np.ndarray
+        The label of each row.
+    """
+    column = collection.rows( ecotype, positions, [ ref_col ] )[ref_col]
+    if isinstance( column.dtype, pd.CategoricalDtype ):
+        vocabulary = column.cat.categories
+        key = ( collection.key, ref_col, _vocabulary_hash( vocabulary ), stable_hash( subsets ) )
+        codes = column.cat.codes.to_numpy()
+    else:
+        codes, vocabulary = pd.factorize( column )
+        key = None
+
+    vocabulary_labels = _vocabulary_labels( key, vocabulary, subsets )
+    result = np.full( len( codes ), DEFAULT_LABEL, dtype = object )
+    known = codes >= 0
+    result[known] = vocabulary_labels[ codes[known] ]
+    return result
+
+
+def _vocabulary_labels( key, vocabulary, subsets ):
+    """
+    Match a vocabulary, reusing the labels of an identical (shared) vocabulary if `key` is given.
+    """
+    if key is None:
+        return Matcher( subsets ).match( vocabulary )
+    return labels.get_or_set( key, lambda: persist.get_or_set( ( "labels", ) + key, lambda: Matcher( subsets ).match( vocabulary ) ) )
+
+
+def _vocabulary_hash( vocabulary ):
+    """
+    Compute a hash of a vocabulary (which is cheap compared to matching it).
+    """
+    return content_hash( pd.util.hash_array( np.asarray( vocabulary, dtype = object ) ).tobytes() )
@@ -0,0 +1,122 @@
+"""
+Compact dtypes for collections.
+
+Collections usually arrive with `float64` scores and `object` columns whose labels (`CellType`, `Term`, ...)
+repeat in every EcoType. When a collection is loaded, its numeric columns are downcast where this loses
+(almost) no precision, and repeated labels are converted to categoricals that share a single (sorted) dictionary
+across all EcoTypes, so that each label (and each gene list that repeats often enough) is only stored once. Columnar collections are
+not normalized at load (they are memory-mapped and only read column by column), but they keep the dtypes of the
+collection they were converted from.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+
+FLOAT_RTOL = float( os.environ.get( "ECO_HELPER_VIEWER_FLOAT_RTOL", 1e-6 ) )
+CATEGORY_RATIO = float( os.environ.get( "ECO_HELPER_VIEWER_CATEGORY_RATIO", 0.5 ) )
+
+LABEL_COLUMNS = ( "CellType", "Term" )
+
+
+def normalize( collection, progress = None ):
+    """
+    Convert the DataFrames of a collection to compact dtypes.
+
+    The dtype of each column is decided across all EcoTypes, so that all DataFrames keep the same dtypes
+    (and can be stacked or written to a columnar file).
+
+    Parameters
+    ----------
+    collection : dict or eco_helper.EnrichmentCollection
+        The collection to normalize.
+    progress : callable
+        A function that is called with the fraction of normalized EcoTypes and a message.
+
+    Returns
+    -------
+    tuple
+        The dictionary of normalized DataFrames and a dictionary of the memory usage (in bytes) `before` and `after`.
+    """
+    frames = { ecotype : collection[ecotype] for ecotype in collection.keys() }
+    before = sum( nbytes( df ) for df in frames.values() )
+    dtypes = _dtypes( list( frames.values() ) )
+
+    normalized = {}
+    for ecotype, df in frames.items():
+        normalized[ecotype] = df.astype( { column : dtype for column, dtype in dtypes.items() if column in df.columns } )
+        if progress:
+            progress( len( normalized ) / len( frames ), f"Normalized EcoType {ecotype}" )
+
+    after = sum( nbytes( df ) for df in normalized.values() )
+    return normalized, dict( before = before, after = after )
+
+
+def nbytes( df ):
+    """
+    The (deep) memory usage of a DataFrame.
+    """
+    return int( df.memory_usage( index = True, deep = True ).sum() )
+
+
+def compact( df ):
+    """
+    Drop the unused categories of a DataFrame's categorical columns (e.g. of a single dataset that is plotted).
+    """
+    columns = [ i for i in df.columns if isinstance( df[i].dtype, pd.CategoricalDtype ) ]
+    if not columns:
+        return df
+    return df.assign( **{ i : df[i].cat.remove_unused_categories() for i in columns } )
+
+
+def _dtypes( frames ):
+    """
+    Decide the compact dtype of each column of a list of DataFrames.
+
+    Returns
+    -------
+    dict
+        The columns to convert and their new dtypes.
+    """
+    columns = list( dict.fromkeys( column for df in frames for column in df.columns ) )
+    dtypes = {}
+    for column in columns:
+        values = [ df[column] for df in frames if column in df.columns ]
+        dtype = values[0].dtype
+        if any( i.dtype != dtype for i in values ):
+            continue
+        if pd.api.types.is_float_dtype( dtype ) and dtype != np.float32:
+            if all( _close_as_float32( i ) for i in values ):
+                dtypes[column] = np.float32
+        elif pd.api.types.is_integer_dtype( dtype ):
+            smallest = np.result_type( *[ pd.to_numeric( i, downcast = "integer" ).dtype for i in values ] )
+            if smallest != dtype:
+                dtypes[column] = smallest
+        elif dtype == object or isinstance( dtype, pd.StringDtype ):
+            categories = _categories( values, force = column in LABEL_COLUMNS )
+            if categories is not None:
+                dtypes[column] = pd.CategoricalDtype( categories )
+    return dtypes
+
+
+def _close_as_float32( values ):
+    """
+    Check if a float column keeps its values (up to `FLOAT_RTOL`) as `float32`.
+    """
+    values = values.to_numpy()
+    with np.errstate( over = "ignore", under = "ignore" ):
+        downcast = values.astype( np.float32 )
+    return bool( np.allclose( downcast, values, rtol = FLOAT_RTOL, atol = 0, equal_nan = True ) )
+
+
+def _categories( values, force = False ):
+    """
+    The shared (sorted) categories of an object column, or None if the column has too many distinct values to benefit.
+    """
+    unique = pd.unique( np.concatenate( [ i.to_numpy( dtype = object ) for i in values ] ) )
+    unique = [ i for i in unique if pd.notna( i ) ]
+    if not all( isinstance( i, str ) for i in unique ):
+        return None
+    if not force and len( unique ) > CATEGORY_RATIO * sum( len( i ) for i in values ):
+        return None
+    return sorted( unique )
@@ -0,0 +1,117 @@
+"""
+Parsing of highlighting patterns and subsets.
+
+Patterns and subsets are entered as text (or uploaded as files), which is parsed as `json` or as `python` literals,
+but never executed. Every regex is compiled once to validate it. Parsed results are cached by the content hash
+of the text, so that reruns with unchanged text do not parse or compile anything again.
+"""
+
+import os
+import re
+import ast
+import json
+from cache import LRUCache, content_hash
+
+MAX_CACHED_PARSES = int( os.environ.get( "ECO_HELPER_VIEWER_CACHED_PARSES", 256 ) )
+
+parsed = LRUCache( max_entries = MAX_CACHED_PARSES )
+
+
+def parse_patterns( text ):
+    """
+    Parse the patterns of a single subset.
+
+    The text may be a single (quoted) pattern, a `list` or `tuple` of quoted patterns, or an unquoted pattern.
+
+    Parameters
+    ----------
+    text : str
+        The text to parse.
+
+    Returns
+    -------
+    tuple
+        The patterns (a string, a list of strings, or None if the text is empty or invalid) and a list of error messages.
+    """
+    text = ( text or "" ).strip()
+    patterns, errors = parsed.get_or_set( ( "patterns", content_hash( text.encode() ) ), lambda: _parse_patterns( text ) )
+    return ( list( patterns ) if isinstance( patterns, list ) else patterns ), errors
+
+
+def parse_subsets( text ):
+    """
+    Parse a dictionary of subset labels and their patterns.
+
+    The text may be a `json` object or a `python` dictionary literal. Subsets without patterns are dropped.
+
+    Parameters
+    ----------
+    text : str
+        The text to parse.
+
+    Returns
+    -------
+    tuple
+        The subsets (or None if the text is invalid) and a list of error messages.
+    """
+    text = ( text or "" ).strip()
+    subsets, errors = parsed.get_or_set( ( "subsets", content_hash( text.encode() ) ), lambda: _parse_subsets( text ) )
+    return ( dict( subsets ) if subsets is not None else None ), errors
+
+
+def _parse_patterns( text ):
+    if not text:
+        return None, []
+    try:
+        value = ast.literal_eval( text )
+    except ( ValueError, SyntaxError, MemoryError, RecursionError ):
+        value = [ text ]
+
+    if isinstance( value, tuple ):
+        value = list( value )
+    errors = _validate( value )
+    return ( None if errors else value ), errors
+
+
+def _parse_subsets( text ):
+    if not text:
+        return {}, []
+    try:
+        value = json.loads( text )
+    except ValueError:
+        try:
+            value = ast.literal_eval( text )
+        except ( ValueError, SyntaxError, MemoryError, RecursionError ) as e:
+            return None, [ f"The subsets could not be parsed: {e}" ]
+
+    if not isinstance( value, dict ):
+        return None, [ "The subsets must be a dictionary of subset labels and their patterns." ]
+
+    subsets, errors = {}, []
+    for label, patterns in value.items():
+        if patterns is None:
+            continue
+        if isinstance( patterns, tuple ):
+            patterns = list( patterns )
+        errors += _validate( patterns, label )
+        subsets[ str( label ) ] = patterns
+    return ( None if errors else subsets ), errors
+
+
+def _validate( patterns, label = None ):
+    """
+    Check that patterns are strings (or a list of strings) and valid regexes.
+    """
+    where = f" of subset '{label}'" if label is not None else ""
+    if isinstance( patterns, str ):
+        patterns = [ patterns ]
+    if not isinstance( patterns, list ) or not all( isinstance( i, str ) for i in patterns ):
+        return [ f"The patterns{where} must be a string or a list of strings." ]
+
+    errors = []
+    for pattern in patterns:
+        try:
+            re.compile( pattern )
+        except re.error as e:
+            errors.append( f"Invalid pattern `{pattern}`{where}: {e}" )
+    return errors
@@ -0,0 +1,151 @@
+"""
+A disk cache of collections and the structures derived from them, kept across server restarts.
+
+If the `ECO_HELPER_VIEWER_CACHE_DIR` environment variable points to a directory, normalized collections and their
+derived structures (row and term indexes, subset labels, summaries) are pickled into it, named by a hash of their
+key (which starts with the content hash of the collection). After a restart or redeploy they are loaded from
+there instead of being rebuilt. The directory is kept below `ECO_HELPER_VIEWER_CACHE_DIR_MB` by removing the least
+recently used entries.
+
+Each entry starts with a header recording the `VERSION` of the cache format and the versions of `python`,
+`pandas` and `numpy` it was written with. Entries whose header does not match (or that cannot be read) are
+removed and rebuilt, rather than misread. Increase `VERSION` whenever a cached structure changes its format.
+"""
+
+import os
+import sys
+import pickle
+import tempfile
+import contextlib
+import numpy as np
+import pandas as pd
+from cache import stable_hash
+
+CACHE_DIR = os.environ.get( "ECO_HELPER_VIEWER_CACHE_DIR" )
+MAX_CACHE_DIR_MB = int( os.environ.get( "ECO_HELPER_VIEWER_CACHE_DIR_MB", 8192 ) )
+
+VERSION = 1
+
+HEADER = dict( version = VERSION, python = sys.version_info[:2], pandas = pd.__version__, numpy = np.__version__ )
+
+
+def enabled():
+    """
+    Check if the disk cache is enabled.
+    """
+    return bool( CACHE_DIR )
+
+
+def path_of( key ):
+    """
+    The path of the cache entry of a key.
+    """
+    return os.path.join( CACHE_DIR, f"{stable_hash( key )}.pkl" )
+
+
+def get_or_set( key, factory, progress = None ):
+    """
+    Get an entry from the disk cache or compute and store it if it does not exist (or is stale).
+
+    Keys must not be reused for different contents, so they should include the content hash of the collection
+    an entry is derived from. If the cache is disabled, the value is always computed.
+
+    Parameters
+    ----------
+    key : tuple
+        The key of the entry (a JSON-like object).
+    factory : callable
+        A function without arguments that computes the value.
+    progress : callable
+        A function that is called with a fraction and a message once an entry was loaded from the cache.
+    """
+    if not enabled():
+        return factory()
+
+    path = path_of( key )
+    value = _read( path )
+    if value is not None:
+        if progress:
+            progress( 1.0, "Loaded from the disk cache" )
+        return value
+
+    value = factory()
+    with contextlib.suppress( OSError, pickle.PicklingError, TypeError, AttributeError ):
+        _write( value, path )
+    return value
+
+
+def clear():
+    """
+    Remove all entries from the disk cache.
+    """
+    if not enabled() or not os.path.isdir( CACHE_DIR ):
+        return
+    for file in os.listdir( CACHE_DIR ):
+        if file.endswith( ".pkl" ):
+            with contextlib.suppress( FileNotFoundError ):
+                os.remove( os.path.join( CACHE_DIR, file ) )
+
+
+def _read( path ):
+    """
+    Read a cache entry and mark it as recently used, or remove it if it is stale or cannot be read.
+
+    Returns
+    -------
+    object
+        The cached value, or None if there is no (current) entry.
+    """
+    try:
+        with open( path, "rb" ) as f:
+            if pickle.load( f ) != HEADER:
+                raise ValueError( "stale cache entry" )
+            value = pickle.load( f )
+    except FileNotFoundError:
+        return None
+    except Exception:
+        with contextlib.suppress( FileNotFoundError ):
+            os.remove( path )
+        return None
+    with contextlib.suppress( FileNotFoundError ):
+        os.utime( path )
+    return value
+
+
+def _write( value, path ):
+    """
+    Write a cache entry (atomically, via a temporary file) and evict old entries if the cache is too large.
+    """
+    os.makedirs( CACHE_DIR, exist_ok = True )
+    handle, tmp = tempfile.mkstemp( dir = CACHE_DIR, suffix = ".tmp" )
+    try:
+        with os.fdopen( handle, "wb" ) as f:
+            pickle.dump( HEADER, f, protocol = pickle.HIGHEST_PROTOCOL )
+            pickle.dump( value, f, protocol = pickle.HIGHEST_PROTOCOL )
+        os.replace( tmp, path )
+    finally:
+        if os.path.exists( tmp ):
+            os.remove( tmp )
+    _evict( keep = path )
+
+
+def _evict( keep = None ):
+    """
+    Remove the least recently used entries while the cache exceeds its size limit.
+    """
+    files = []
+    for file in os.listdir( CACHE_DIR ):
+        if file.endswith( ".pkl" ):
+            with contextlib.suppress( FileNotFoundError ):
+                stat = os.stat( os.path.join( CACHE_DIR, file ) )
+                files.append( ( stat.st_mtime, stat.st_size, os.path.join( CACHE_DIR, file ) ) )
+    files.sort()
+    total = sum( size for _, size, _ in files )
+    for _, size, file in files:
+        if total <= MAX_CACHE_DIR_MB * 2**20:
+            break
+        if file == keep:
+            continue
+        total -= size
+        with contextlib.suppress( FileNotFoundError ):
+            os.remove( file )
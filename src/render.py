@@ -0,0 +1,162 @@
+"""
+The figure render cache.
+
+Every widget interaction reruns the page from the top, which would rebuild every figure. Instead,
+finished figures are stored (as plotly JSON or rendered PNG bytes) under a key of the input data identity
+and the exact figure settings, and unchanged figures are shown from the cache.
+
+Independent figures can be built concurrently in a thread pool (see `concurrently`). Since `visualise`
+draws on matplotlib's global `pyplot` state and has a global backend, any use of them is guarded by the `pyplot` lock.
+"""
+
+import io
+import os
+import pickle
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from cache import LRUCache, stable_hash
+
+MAX_RENDERED = int( os.environ.get( "ECO_HELPER_VIEWER_CACHED_FIGURES", 128 ) )
+MAX_RENDERED_MB = int( os.environ.get( "ECO_HELPER_VIEWER_RENDER_CACHE_MB", 512 ) )
+
+MAX_RENDER_WORKERS = int( os.environ.get( "ECO_HELPER_VIEWER_RENDER_WORKERS", 4 ) )
+
+figures = LRUCache( max_entries = MAX_RENDERED, max_bytes = MAX_RENDERED_MB * 2**20 )
+
+pyplot = threading.RLock()
+
+executor = ThreadPoolExecutor( max_workers = MAX_RENDER_WORKERS, thread_name_prefix = "render" )
+
+
+class Rendered:
+    """
+    A rendered figure.
+
+    Parameters
+    ----------
+    figure : plotly.graph_objects.Figure or matplotlib.figure.Figure
+        The finished figure.
+    backend : str
+        The backend the figure was made with.
+    data : pandas.DataFrame
+        The table that belongs to the figure (if any).
+    dpi : int
+        The resolution to render matplotlib figures at.
+    key : str
+        The render cache key of the figure.
+    """
+    def __init__( self, figure, backend, data = None, dpi = 200, key = None ):
+        self.key = key
+        self.backend = backend
+        self.data = data
+        self._pickled = None
+        if backend == "plotly":
+            self.payload = figure.to_json()
+        else:
+            buffer = io.BytesIO()
+            figure.savefig( buffer, format = "png", bbox_inches = "tight", dpi = dpi )
+            self.payload = buffer.getvalue()
+            import matplotlib.pyplot as plt
+            with pyplot:
+                plt.close( figure )
+            # the figure is kept pickled rather than as an object, so its size is known (and counted in `nbytes`).
+            # It is pickled after it was closed, so that it is not restored into pyplot.
+            self._pickled = pickle.dumps( figure )
+
+    @property
+    def nbytes( self ):
+        """
+        The size of the rendered (and pickled) figure and its table.
+        """
+        size = len( self.payload )
+        if self._pickled is not None:
+            size += len( self._pickled )
+        if self.data is not None:
+            size += int( self.data.memory_usage( index = True, deep = True ).sum() )
+        return size
+
+    @property
+    def figure( self ):
+        """
+        The figure object (restored from its JSON or pickle).
+        """
+        if self.backend == "plotly":
+            import plotly.io as pio
+            return pio.from_json( self.payload, skip_invalid = True )
+        return pickle.loads( self._pickled )
+
+    def show( self, container ):
+        """
+        Show the figure in a container.
+        """
+        if self.backend == "plotly":
+            container.plotly_chart( self.figure, use_container_width = True )
+        else:
+            container.image( self.payload, use_column_width = True )
+
+
+def rendered( key, build, backend, dpi = 200 ):
+    """
+    Get a rendered figure, building it only if it is not in the render cache yet.
+
+    Parameters
+    ----------
+    key : dict
+        The identity of the input data and all settings the figure depends on.
+    build : callable
+        A function without arguments that builds the figure. It returns either the figure
+        or a tuple of the figure and its table.
+    backend : str
+        The backend the figure is made with.
+    dpi : int
+        The resolution to render matplotlib figures at.
+
+    Returns
+    -------
+    Rendered
+        The rendered figure.
+    """
+    key = ( backend, stable_hash( key ) )
+
+    def _render():
+        result = build()
+        fig, data = result if isinstance( result, tuple ) else ( result, None )
+        return Rendered( fig, backend, data, dpi, key )
+
+    return figures.get_or_set( key, _render, size = lambda r: r.nbytes )
+
+
+def figure( container, key, build, backend, dpi = 200 ):
+    """
+    Show a figure, building it only if it is not in the render cache yet (see `rendered`).
+
+    Returns
+    -------
+    Rendered
+        The rendered figure.
+    """
+    result = rendered( key, build, backend, dpi )
+    result.show( container )
+    return result
+
+
+def concurrently( jobs ):
+    """
+    Build several figures concurrently and yield them as they complete.
+
+    The figures are only built in the worker threads; showing them (and any other streamlit calls) 
+    is left to the caller, which receives them in its own thread.
+
+    Parameters
+    ----------
+    jobs : dict
+        The names of the figures and their render jobs, as tuples of the arguments of `rendered`.
+
+    Yields
+    ------
+    tuple
+        The name and the `Rendered` figure of each job, in order of completion.
+    """
+    futures = { executor.submit( rendered, *job ) : name for name, job in jobs.items() }
+    for future in as_completed( futures ):
+        yield futures[future], future.result()
@@ -0,0 +1,267 @@
+"""
+Search terms across all EcoTypes and celltypes/states of a collection.
+
+The term index of a collection is built once when the collection is loaded. It stores the vocabulary of
+(unique) terms together with a trigram index over it, and the rows of each term. A query is answered by
+prefiltering the vocabulary with the trigrams of the literal parts of the query, matching the remaining
+candidate terms against the query and only then reading the score and q-values of their rows.
+"""
+
+import os
+import re
+from collections import defaultdict
+import numpy as np
+import pandas as pd
+import store
+from cache import LRUCache
+
+MAX_CACHED_SEARCHES = int( os.environ.get( "ECO_HELPER_VIEWER_CACHED_SEARCHES", 64 ) )
+
+results = LRUCache( max_entries = MAX_CACHED_SEARCHES )
+
+
+class TermIndex:
+    """
+    A trigram index over the terms of a collection.
+
+    Parameters
+    ----------
+    collection : FrozenCollection or columnar.LazyCollection
+        The collection to index.
+    progress : callable
+        A function that is called with the fraction of indexed EcoTypes and a message.
+    """
+    def __init__( self, collection, progress = None ):
+        self.collection = collection
+        self.ecotypes = list( collection.keys() )
+
+        terms, celltypes = [], []
+        for ecotype in self.ecotypes:
+            frame = collection.frame( ecotype, [ "CellType", "Term" ] )
+            terms.append( np.asarray( frame["Term"], dtype = object ) )
+            celltypes.append( np.asarray( frame["CellType"], dtype = object ) )
+            if progress:
+                progress( len( terms ) / len( self.ecotypes ), f"Indexed the terms of EcoType {ecotype}" )
+
+        # rows are numbered across all EcoTypes, the rows of an EcoType start at its offset
+        self._offsets = np.cumsum( [ 0 ] + [ len( i ) for i in terms ] )
+        codes, self.terms = pd.factorize( np.concatenate( terms ) if terms else np.array( [], dtype = object ) )
+        self._celltypes, self.celltypes = pd.factorize( np.concatenate( celltypes ) if celltypes else np.array( [], dtype = object ) )
+        self._terms = codes
+
+        # the rows of each term (missing terms have code -1 and are left out)
+        self._order = np.argsort( codes, kind = "stable" )
+        self._bounds = np.searchsorted( codes[ self._order ], np.arange( len( self.terms ) + 1 ) )
+
+        self._strings = [ str( i ) for i in self.terms ]
+        trigrams = defaultdict( list )
+        for code, term in enumerate( i.lower() for i in self._strings ):
+            for trigram in { term[i:i+3] for i in range( len( term ) - 2 ) }:
+                trigrams[trigram].append( code )
+        self._trigrams = { trigram : np.array( codes, dtype = np.int64 ) for trigram, codes in trigrams.items() }
+
+    def __len__( self ):
+        return len( self._terms )
+
+    def __getstate__( self ):
+        # the collection is not persisted (see `store.derive`)
+        return dict( self.__dict__, collection = None )
+
+    def candidates( self, literals ):
+        """
+        The codes of the terms that contain all trigrams of the given (lowercase) literals.
+
+        If none of the literals is long enough to have a trigram, all terms are candidates.
+        """
+        trigrams = { literal[i:i+3] for literal in literals for i in range( len( literal ) - 2 ) }
+        if not trigrams:
+            return np.arange( len( self.terms ) )
+        postings = sorted( ( self._trigrams.get( i, np.array( [], dtype = np.int64 ) ) for i in trigrams ), key = len )
+        codes = postings[0]
+        for i in postings[1:]:
+            if not len( codes ):
+                break
+            codes = np.intersect1d( codes, i, assume_unique = True )
+        return codes
+
+    def matching( self, query, regex = False, match_case = False ):
+        """
+        The codes of the terms that match a query.
+
+        Parameters
+        ----------
+        query : str
+            The substring or regular expression to search for.
+        regex : bool
+            If `True`, the query is interpreted as a `python`-style regular expression.
+        match_case : bool
+            If `True`, the search is case-sensitive.
+
+        Raises
+        ------
+        re.error
+            If the query is not a valid regular expression.
+        """
+        pattern = re.compile( query if regex else re.escape( query ), 0 if match_case else re.IGNORECASE )
+        literals = required_literals( pattern ) if regex else [ query.lower() ]
+        candidates = self.candidates( literals )
+        return np.array( [ i for i in candidates if pattern.search( self._strings[i] ) ], dtype = np.int64 )
+
+    def search( self, query, score = "log2_score", qval = "log10_qval", regex = False, match_case = False ):
+        """
+        Search the terms of all EcoTypes and celltypes/states.
+
+        Parameters
+        ----------
+        query : str
+            The substring or regular expression to search for.
+        score, qval : str
+            The columns to report as the score and q-value of each match.
+        regex : bool
+            If `True`, the query is interpreted as a `python`-style regular expression.
+        match_case : bool
+            If `True`, the search is case-sensitive.
+
+        Returns
+        -------
+        pandas.DataFrame
+            The matching rows as (EcoType, CellType, Term, score, qval), ranked by descending score and q-value.
+        """
+        codes = self.matching( query, regex, match_case )
+        rows = np.sort( np.concatenate( [ self._order[ self._bounds[i] : self._bounds[i+1] ] for i in codes ] ) ) if len( codes ) else np.array( [], dtype = np.int64 )
+
+        bounds = np.searchsorted( rows, self._offsets )
+        scores, qvals = np.empty( len( rows ) ), np.empty( len( rows ) )
+        for i, ecotype in enumerate( self.ecotypes ):
+            if bounds[i] == bounds[i+1]:
+                continue
+            positions = rows[ bounds[i] : bounds[i+1] ] - self._offsets[i]
+            frame = self.collection.rows( ecotype, positions, [ score, qval ] )
+            scores[ bounds[i] : bounds[i+1] ] = frame[score].to_numpy( dtype = float )
+            qvals[ bounds[i] : bounds[i+1] ] = frame[qval].to_numpy( dtype = float )
+
+        ecotypes = np.searchsorted( self._offsets, rows, side = "right" ) - 1
+        df = pd.DataFrame( {
+                                "EcoType" : np.asarray( self.ecotypes, dtype = object )[ ecotypes ],
+                                "CellType" : np.asarray( self.celltypes, dtype = object )[ self._celltypes[rows] ],
+                                "Term" : np.asarray( self.terms, dtype = object )[ self._terms[rows] ],
+                                score : scores,
+                                qval : qvals,
+                            } )
+        return df.sort_values( [ score, qval ], ascending = False, na_position = "last", kind = "stable" ).reset_index( drop = True )
+
+
+def of( collection, progress = None ):
+    """
+    Get the term index of a collection, building it if it does not exist yet.
+    """
+    return store.derive( collection, "terms", lambda collection: TermIndex( collection, progress ) )
+
+
+def search( collection, query, score = "log2_score", qval = "log10_qval", regex = False, match_case = False ):
+    """
+    Search the terms of a collection (see `TermIndex.search`).
+
+    Results are cached, so repeating a search (e.g. on a rerun, or in another session) does not run it again.
+    The returned DataFrame is shared and must not be modified.
+    """
+    key = ( collection.key, query, score, qval, regex, match_case )
+    return results.get_or_set( key, lambda: of( collection ).search( query, score, qval, regex, match_case ) )
+
+
+def required_literals( pattern ):
+    """
+    The (lowercase) literal substrings that every match of a regular expression must contain.
+
+    This is conservative: groups, character classes and optional characters are skipped, and patterns with alternations
+    have no required literals, so that prefiltering with the literals never drops a match.
+
+    Parameters
+    ----------
+    pattern : re.Pattern
+        The compiled regular expression.
+
+    Returns
+    -------
+    list
+        The literal substrings.
+    """
+    source = pattern.pattern
+    if pattern.flags & re.VERBOSE or "|" in source:
+        return []
+
+    literals, run = [], ""
+    depth, i = 0, 0
+    while i < len( source ):
+        char = source[i]
+        token = None
+        if char == "\\":
+            escaped = source[i+1:i+2]
+            if escaped and not escaped.isalnum() and not depth:
+                token = escaped
+            # escapes of letters or digits (classes, anchors, codes such as `\x61`) end the literal run as a whole
+            i = _escape_end( source, i )
+        elif char == "[":
+            i = _class_end( source, i ) + 1
+        elif char == "{":
+            end = source.find( "}", i )
+            i = end + 1 if end != -1 else len( source )
+        else:
+            if char == "(":
+                depth += 1
+            elif char == ")":
+                depth = max( depth - 1, 0 )
+            elif not depth and char not in ".^$?*+":
+                token = char
+            i += 1
+
+        quantifier = source[i:i+1]
+        if token is not None and quantifier in ( "?", "*", "{" ):
+            token = None
+        if token is None:
+            literals.append( run )
+            run = ""
+            continue
+        run += token
+        if quantifier == "+":
+            literals.append( run )
+            run = ""
+    literals.append( run )
+    return [ i.lower() for i in literals if i ]
+
+
+def _escape_end( source, start ):
+    """
+    The position after the escape starting (with its backslash) at `start`.
+    """
+    escaped = source[start+1:start+2]
+    if escaped == "x":
+        return start + 4
+    if escaped == "u":
+        return start + 6
+    if escaped == "U":
+        return start + 10
+    if escaped == "N" and source[start+2:start+3] == "{":
+        end = source.find( "}", start )
+        return end + 1 if end != -1 else len( source )
+    if escaped.isdigit():
+        # octal codes have up to three digits, group references up to two
+        end = start + 2
+        while end < len( source ) and end < start + 4 and source[end].isdigit():
+            end += 1
+        return end
+    return start + 2
+
+
+def _class_end( source, start ):
+    """
+    The position of the bracket that closes the character class starting at `start`.
+    """
+    i = start + 1
+    if source[i:i+1] == "^":
+        i += 1
+    if source[i:i+1] == "]":
+        i += 1
+    while i < len( source ) and source[i] != "]":
+        i += 2 if source[i] == "\\" else 1
+    return i
@@ -0,0 +1,119 @@
+"""
+A collection store shared by several server processes.
+
+If the `ECO_HELPER_VIEWER_SHARED_DIR` environment variable points to a directory (ideally on a memory-backed
+file system such as `/dev/shm`), uploaded collections are materialized once into a columnar file in that
+directory, named by the hash of their contents. Every server process memory-maps the same file, so the
+collection's data is held once in the (shared) page cache instead of once per process.
+"""
+
+import os
+import pickle
+import tempfile
+import contextlib
+import columnar
+import normalize
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+SHARED_DIR = os.environ.get( "ECO_HELPER_VIEWER_SHARED_DIR" )
+MAX_SHARED_MB = int( os.environ.get( "ECO_HELPER_VIEWER_SHARED_MB", 16384 ) )
+
+
+def enabled():
+    """
+    Check if the shared store is enabled.
+    """
+    return bool( SHARED_DIR )
+
+
+def path_of( key ):
+    """
+    The path of the columnar file of a collection in the shared store.
+    """
+    return os.path.join( SHARED_DIR, f"{key}.arrow" )
+
+
+def attach( key, file ):
+    """
+    Attach to the shared copy of a collection, materializing it first if no process has done so yet.
+
+    Parameters
+    ----------
+    key : str
+        The content hash of the collection.
+    file : file-like
+        The uploaded pickle or columnar file.
+
+    Returns
+    -------
+    columnar.LazyCollection
+        The memory-mapped collection.
+    """
+    path = path_of( key )
+    if not os.path.exists( path ):
+        os.makedirs( SHARED_DIR, exist_ok = True )
+        with _lock( key ):
+            if not os.path.exists( path ):
+                _materialize( file, path )
+                _evict( keep = path )
+    os.utime( path )
+    return columnar.LazyCollection( path, key )
+
+
+def _materialize( file, path ):
+    """
+    Write an uploaded collection to the shared store (atomically, via a temporary file).
+    """
+    handle, tmp = tempfile.mkstemp( dir = SHARED_DIR, suffix = ".tmp" )
+    try:
+        os.close( handle )
+        if columnar.is_columnar( file ):
+            with open( tmp, "wb" ) as f:
+                f.write( file.getbuffer() )
+        else:
+            file.seek( 0 )
+            columnar.write( normalize.normalize( pickle.load( file ) )[0], tmp )
+        os.replace( tmp, path )
+    finally:
+        if os.path.exists( tmp ):
+            os.remove( tmp )
+
+
+def _evict( keep = None ):
+    """
+    Remove the least recently used collections while the shared store exceeds its size limit.
+
+    Processes that still have a removed file memory-mapped keep their mapping.
+    """
+    files = [ os.path.join( SHARED_DIR, i ) for i in os.listdir( SHARED_DIR ) if i.endswith( ".arrow" ) ]
+    files = sorted( files, key = os.path.getmtime )
+    total = sum( os.path.getsize( i ) for i in files )
+    for file in files:
+        if total <= MAX_SHARED_MB * 2**20:
+            break
+        if file == keep:
+            continue
+        total -= os.path.getsize( file )
+        os.remove( file )
+        with contextlib.suppress( FileNotFoundError ):
+            os.remove( file.replace( ".arrow", ".lock" ) )
+
+
+@contextlib.contextmanager
+def _lock( key ):
+    """
+    Hold an exclusive lock on a collection across processes.
+    """
+    if fcntl is None:
+        yield
+        return
+    with open( os.path.join( SHARED_DIR, f"{key}.lock" ), "w" ) as f:
+        fcntl.flock( f, fcntl.LOCK_EX )
+        try:
+            yield
+        finally:
+            fcntl.flock( f, fcntl.LOCK_UN )
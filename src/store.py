@@ -0,0 +1,239 @@
+"""
+The shared collection store.
+
+Collections are loaded once per server process and handed out to all sessions as read-only objects,
+keyed by a hash of the uploaded contents. Pickled collections are converted to compact dtypes when they are loaded (see `normalize`).
+If the disk cache is enabled, normalized collections and derived structures are also kept across restarts (see `persist`).
+"""
+
+import os
+import pickle
+from cache import LRUCache, content_hash
+import columnar
+import shared
+import normalize
+import persist
+
+MAX_COLLECTIONS = int( os.environ.get( "ECO_HELPER_VIEWER_MAX_COLLECTIONS", 4 ) )
+MAX_COLLECTIONS_MB = int( os.environ.get( "ECO_HELPER_VIEWER_CACHE_MB", 4096 ) )
+
+
+def _forget( key, collection ):
+    """
+    Drop the derived structures of an evicted collection, since they refer to it and would keep it in memory.
+    """
+    derived.pop_where( lambda derived_key: derived_key[0] == key )
+
+
+collections = LRUCache( max_entries = MAX_COLLECTIONS, max_bytes = MAX_COLLECTIONS_MB * 2**20, on_evict = _forget )
+derived = LRUCache( max_entries = MAX_COLLECTIONS * 16 )
+
+
+class FrozenCollection( dict ):
+    """
+    A read-only dictionary of EcoType labels and their DataFrames.
+
+    Parameters
+    ----------
+    data : dict
+        The EcoType labels and DataFrames.
+    key : str
+        The content hash of the source the collection was loaded from.
+    memory : dict
+        The memory usage (in bytes) of the collection `before` and `after` it was normalized.
+    """
+    def __init__( self, data, key = None, memory = None ):
+        super().__init__( data )
+        self.key = key
+        self.memory = memory
+
+    def __reduce__( self ):
+        return ( type( self ), ( dict( self ), self.key, self.memory ) )
+
+    @property
+    def nbytes( self ):
+        """
+        The memory usage of the collection.
+        """
+        if self.memory:
+            return self.memory["after"]
+        return sum( normalize.nbytes( df ) for df in self.values() )
+
+    @property
+    def columns( self ):
+        """
+        The columns of the collection's DataFrames.
+        """
+        return list( next( iter( self.values() ) ).columns )
+
+    def frame( self, ecotype, columns = None ):
+        """
+        Get the DataFrame of an EcoType, optionally only with the given columns.
+        """
+        df = self[ecotype]
+        return df[ list( columns ) ] if columns is not None else df
+
+    def project( self, columns ):
+        """
+        Get a dictionary of DataFrames with only the given columns.
+
+        Since all data is already in memory, this returns the collection itself.
+        """
+        return self
+
+    def rows( self, ecotype, positions, columns = None ):
+        """
+        Get the rows at the given positions of an EcoType's DataFrame.
+        """
+        return self.frame( ecotype, columns ).iloc[ positions ]
+
+    def _readonly( self, *args, **kwargs ):
+        raise TypeError( "Shared collections are read-only." )
+
+    __setitem__ = __delitem__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+
+def freeze( collection, key = None, memory = None ):
+    """
+    Convert an `eco_helper.EnrichmentCollection` or a dictionary of DataFrames to a `FrozenCollection`.
+    """
+    return FrozenCollection( { ecotype : collection[ecotype] for ecotype in collection.keys() }, key, memory )
+
+
+def _unpickle( file, size, key, progress = None ):
+    """
+    Unpickle a collection and convert it to compact dtypes.
+    """
+    collection = pickle.load( _ProgressReader( file, size, progress ) )
+    collection, memory = normalize.normalize( collection, progress )
+    return freeze( collection, key, memory )
+
+
+def _unpickle_path( path, size, key, progress = None ):
+    """
+    Unpickle a collection from a file on the server (see `_unpickle`).
+    """
+    with open( path, "rb" ) as f:
+        return _unpickle( f, size, key, progress )
+
+
+def open_collection( file, progress = None ):
+    """
+    Get the collection stored in an uploaded file or a file on the server.
+
+    The file is only loaded if no collection with the same contents is already in the store.
+    Pickle files are unpickled entirely, while columnar files are opened lazily (see `columnar`).
+    If the shared store is enabled, uploads are materialized into it and memory-mapped instead (see `shared`).
+
+    Parameters
+    ----------
+    file : file-like or str
+        The uploaded pickle or columnar file, or the path to a file on the server.
+    progress : callable
+        A function that is called with the fraction of the file that was ingested and a message.
+        Uploads are read directly from the uploaded file object, without copying their contents first.
+
+    Returns
+    -------
+    FrozenCollection or columnar.LazyCollection
+        The shared collection.
+    """
+    if isinstance( file, ( str, os.PathLike ) ):
+        return _open_path( str( file ), progress )
+
+    key = content_hash( file )
+    if shared.enabled():
+        return collections.get_or_set( key, lambda: shared.attach( key, file ), size = 0 )
+
+    size = getattr( file, "size", None ) or len( file.getbuffer() )
+
+    def _load():
+        if columnar.is_columnar( file ):
+            return columnar.LazyCollection( file, key )
+        file.seek( 0 )
+        return persist.get_or_set( ( "collection", key ), lambda: _unpickle( file, size, key, progress ), progress )
+
+    return collections.get_or_set( key, _load, size = lambda collection: collection.nbytes )
+
+def _open_path( path, progress = None ):
+    """
+    Get the collection stored in a file on the server.
+
+    Files are identified by their path, size and modification time rather than their contents,
+    so that large (memory-mapped) files do not need to be read in full to be looked up.
+    """
+    stat = os.stat( path )
+    key = content_hash( f"{os.path.abspath( path )}:{stat.st_size}:{stat.st_mtime_ns}".encode() )
+
+    def _load():
+        if columnar.is_columnar( path ):
+            return columnar.LazyCollection( path, key )
+        return persist.get_or_set( ( "collection", key ), lambda: _unpickle_path( path, stat.st_size, key, progress ), progress )
+
+    return collections.get_or_set( key, _load, size = lambda collection: collection.nbytes )
+
+
+class _ProgressReader:
+    """
+    A file wrapper that reports how much of a file was read (e.g. while unpickling it).
+    """
+    def __init__( self, file, size, progress = None, step = 0.01 ):
+        self._file = file
+        self._size = size or 1
+        self._progress = progress
+        self._step = step
+        self._reported = 0
+
+    def _report( self ):
+        if not self._progress:
+            return
+        fraction = min( self._file.tell() / self._size, 1.0 )
+        if fraction - self._reported >= self._step or fraction == 1.0:
+            self._reported = fraction
+            self._progress( fraction, f"Read {fraction:.0%} of the collection" )
+
+    def read( self, *args ):
+        data = self._file.read( *args )
+        self._report()
+        return data
+
+    def readinto( self, buffer ):
+        n = self._file.readinto( buffer )
+        self._report()
+        return n
+
+    def readline( self, *args ):
+        data = self._file.readline( *args )
+        self._report()
+        return data
+
+
+def derive( collection, name, builder ):
+    """
+    Get a structure derived from a collection (e.g. an index), building it only once per collection.
+
+    Parameters
+    ----------
+    collection : FrozenCollection or columnar.LazyCollection
+        The collection.
+    name : str
+        The name of the derived structure.
+    builder : callable
+        A function that builds the structure from the collection.
+
+    Notes
+    -----
+    Structures of collections with a content key are also kept in the disk cache (see `persist`). Structures
+    that refer to their collection do not pickle it, so the reference is restored here.
+    """
+    if collection.key is None:
+        return derived.get_or_set( ( id( collection ), name ), lambda: builder( collection ) )
+
+    def _build():
+        structure = persist.get_or_set( ( "derived", collection.key, name ), lambda: builder( collection ) )
+        if hasattr( structure, "collection" ):
+            structure.collection = collection
+        return structure
+
+    return derived.get_or_set( ( collection.key, name ), _build )
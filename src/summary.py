@@ -0,0 +1,116 @@
+"""
+Summary aggregates of collections.
+
+The summary of a collection holds, for each celltype/state of each EcoType, the number of terms, the number of terms
+above the x- and y-thresholds, quantiles of the x- and y-columns, and the top terms. It is computed once per collection
+and columns / thresholds (for the default ones already when the collection is loaded), so the overview of the
+ecotype summary page never needs to plot the terms themselves. Summaries are also kept in the disk cache (see `persist`).
+"""
+
+import os
+import numpy as np
+import pandas as pd
+import persist
+from cache import LRUCache
+
+MAX_CACHED_SUMMARIES = int( os.environ.get( "ECO_HELPER_VIEWER_CACHED_SUMMARIES", 32 ) )
+
+QUANTILES = ( 0.05, 0.25, 0.5, 0.75, 0.95 )
+
+DEFAULTS = dict( x = "log2_score", y = "log10_qval", x_threshold = 1.0, y_threshold = 1.3, n_top = 3 )
+
+summaries = LRUCache( max_entries = MAX_CACHED_SUMMARIES )
+
+
+def of( collection, x = DEFAULTS["x"], y = DEFAULTS["y"], x_threshold = DEFAULTS["x_threshold"], y_threshold = DEFAULTS["y_threshold"], n_top = DEFAULTS["n_top"], progress = None ):
+    """
+    Get the summary of a collection, computing it if it does not exist yet.
+
+    Parameters
+    ----------
+    collection : FrozenCollection or columnar.LazyCollection
+        The collection to summarize.
+    x, y : str
+        The columns to summarize (and to rank the top terms by, `y` first).
+    x_threshold, y_threshold : float
+        The thresholds (exclusive) that terms are counted above.
+    n_top : int
+        The number of top terms to keep per celltype/state.
+    progress : callable
+        A function that is called with the fraction of summarized EcoTypes and a message.
+
+    Returns
+    -------
+    pandas.DataFrame
+        One row per EcoType and celltype/state. This is shared and must not be modified.
+    """
+    key = ( collection.key or id( collection ), x, y, float( x_threshold ), float( y_threshold ), int( n_top ) )
+    build = lambda: summarize( collection, x, y, x_threshold, y_threshold, n_top, progress )
+    if collection.key is not None:
+        return summaries.get_or_set( key, lambda: persist.get_or_set( ( "summary", ) + key, build ) )
+    return summaries.get_or_set( key, build )
+
+
+def summarize( collection, x, y, x_threshold, y_threshold, n_top = 3, progress = None ):
+    """
+    Compute the summary of a collection (see `of`).
+    """
+    columns = list( dict.fromkeys( [ "CellType", "Term", x, y ] ) )
+    tables = []
+    for ecotype in collection.keys():
+        df = collection.frame( ecotype, columns )
+        df = df[ df["CellType"].notna() ]
+        tables.append( _summarize_ecotype( ecotype, df, x, y, x_threshold, y_threshold, n_top ) )
+        if progress:
+            progress( len( tables ) / len( collection ), f"Summarized EcoType {ecotype}" )
+    return pd.concat( tables, ignore_index = True ) if tables else pd.DataFrame()
+
+
+def numeric_columns( collection, columns ):
+    """
+    The columns (of the given ones) that hold numbers and can therefore be summarized.
+    """
+    ecotypes = list( collection.keys() )
+    if not ecotypes:
+        return list( columns )
+    df = collection.frame( ecotypes[0], list( dict.fromkeys( columns ) ) )
+    return [ i for i in columns if pd.api.types.is_numeric_dtype( df[i] ) ]
+
+
+def pivot( table, column ):
+    """
+    Pivot a column of a summary to a DataFrame of EcoTypes (rows) and celltypes/states (columns).
+    """
+    if table.empty:
+        return pd.DataFrame()
+    return table.pivot( index = "EcoType", columns = "CellType", values = column ).reindex( index = pd.unique( table["EcoType"] ) )
+
+
+def _summarize_ecotype( ecotype, df, x, y, x_threshold, y_threshold, n_top ):
+    """
+    Compute the summary rows of a single EcoType.
+    """
+    codes, celltypes = pd.factorize( df["CellType"] )
+    values = df[ [ x, y ] ].astype( float ).set_axis( codes )
+    grouped = values.groupby( level = 0, sort = True )
+
+    table = pd.DataFrame( { "terms" : grouped.size() } )
+    above = ( values[x] > x_threshold ) & ( values[y] > y_threshold )
+    table["above thresholds"] = above.groupby( level = 0, sort = True ).sum().astype( int )
+
+    quantiles = grouped.quantile( list( QUANTILES ) ).unstack()
+    quantiles.columns = [ f"{column} q{int( round( q * 100 ) ):02d}" for column, q in quantiles.columns ]
+    table = table.join( quantiles )
+
+    # the top terms of each celltype/state (by y, then x), without sorting the terms themselves
+    order = np.lexsort( ( -values[x].to_numpy(), -values[y].to_numpy(), codes ) )
+    groups = table.index.to_numpy()
+    starts = np.searchsorted( codes[order], groups, side = "left" )
+    ends = np.searchsorted( codes[order], groups, side = "right" )
+    terms = df["Term"].to_numpy()
+    table["top terms"] = [ "; ".join( map( str, terms[ order[ start : min( start + int( n_top ), end ) ] ] ) ) for start, end in zip( starts, ends ) ]
+
+    table.index = pd.Index( [ str( i ) for i in celltypes[ table.index ] ], name = "CellType" )
+    table = table.reset_index()
+    table.insert( 0, "EcoType", ecotype )
+    return table
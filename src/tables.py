@@ -0,0 +1,115 @@
+"""
+Server-side paged tables.
+
+Instead of sending an entire DataFrame to the browser, a paged table only sends the rows of the current page.
+Filtering, sorting and paging are done on the server: the rows that match a filter and the order of the rows by
+a column are computed once per table and cached, so that turning pages or re-running the page only slices them.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+from cache import LRUCache, stable_hash
+
+MAX_CACHED_VIEWS = int( os.environ.get( "ECO_HELPER_VIEWER_CACHED_TABLE_VIEWS", 64 ) )
+
+PAGE_SIZES = ( 25, 50, 100, 250 )
+
+views = LRUCache( max_entries = MAX_CACHED_VIEWS )
+
+
+def paged_table( container, df, key, name = "table" ):
+    """
+    Show a table one page at a time, with controls for filtering, sorting and paging.
+
+    Parameters
+    ----------
+    container : streamlit.container
+        The container to show the table in.
+    df : pandas.DataFrame
+        The table.
+    key : hashable
+        The identity of the table (e.g. its render cache key), to cache its filtered and sorted rows under.
+    name : str
+        A name for the table's controls, which must be unique on the page.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The rows of the current page.
+    """
+    col1, col2, col3, col4 = container.columns( (3, 2, 1, 1) )
+    query = col1.text_input( "Filter", key = f"{name}_filter", help = "Only show rows that contain this text (in any text column, ignoring case)." )
+    sort = col2.selectbox( "Sort by", options = [ None ] + list( df.columns ), key = f"{name}_sort", help = "The column to sort the rows by." )
+    descending = col3.checkbox( "Descending", value = True, key = f"{name}_descending", help = "Sort the rows in descending order." )
+    page_size = col4.selectbox( "Rows", options = list( PAGE_SIZES ), key = f"{name}_page_size", help = "The number of rows per page." )
+
+    rows = view( df, key, query, sort, descending )
+    n_pages = max( 1, -( -len( rows ) // page_size ) )
+    # the page starts over whenever the filter, sorting or page size change
+    page_key = f"{name}_page_{stable_hash( [ query, sort, descending, page_size, n_pages ] )}"
+    page = col4.number_input( "Page", min_value = 1, max_value = n_pages, value = 1, step = 1, key = page_key, help = f"The page to show (of {n_pages})." )
+
+    start = ( int( page ) - 1 ) * page_size
+    shown = df.iloc[ rows[ start : start + page_size ] ]
+    container.dataframe( shown )
+    container.caption( f"Rows {min( start + 1, len( rows ) )}-{start + len( shown )} of {len( rows )}" + ( f" (filtered from {len( df )})" if len( rows ) != len( df ) else "" ) )
+    return shown
+
+
+def view( df, key, query = None, sort = None, descending = True ):
+    """
+    Get the positions of the rows of a table that match a filter, in sorted order.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        The table.
+    key : hashable
+        The identity of the table.
+    query : str
+        The text to filter the rows by (in any text or categorical column, ignoring case).
+    sort : str
+        The column to sort by (missing values are placed last). If None, the rows keep their order.
+    descending : bool
+        Sort in descending order.
+
+    Returns
+    -------
+    np.ndarray
+        The row positions.
+    """
+    key = stable_hash( key )
+    order = views.get_or_set( ( key, "order", sort, descending ), lambda: _order( df, sort, descending ) )
+    if not query:
+        return order
+    mask = views.get_or_set( ( key, "filter", query ), lambda: _matches( df, query ) )
+    return order[ mask[order] ]
+
+
+def _order( df, sort, descending ):
+    """
+    The positions of the rows sorted by a column (stably, with missing values last).
+    """
+    if sort is None:
+        return np.arange( len( df ) )
+    column = df[sort].reset_index( drop = True )
+    return column.sort_values( ascending = not descending, na_position = "last", kind = "mergesort" ).index.to_numpy()
+
+
+def _matches( df, query ):
+    """
+    Check which rows contain a text in any of their text or categorical columns (ignoring case).
+
+    Categorical columns are only searched in their categories, which are then looked up through the codes.
+    """
+    query = query.lower()
+    mask = np.zeros( len( df ), dtype = bool )
+    for column in df.columns:
+        values = df[column]
+        if isinstance( values.dtype, pd.CategoricalDtype ):
+            found = np.array( [ query in str( i ).lower() for i in values.cat.categories ] + [ False ], dtype = bool )
+            mask |= found[ values.cat.codes.to_numpy() ]
+        elif values.dtype == object or isinstance( values.dtype, pd.StringDtype ):
+            mask |= values.notna().to_numpy() & values.astype( str ).str.lower().str.contains( query, regex = False ).to_numpy( dtype = bool )
+    return mask
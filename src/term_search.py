@@ -0,0 +1,71 @@
+"""
+Controls for the term search page.
+"""
+
+import re
+import streamlit as st
+from wrappers import sessionize
+import core
+import controls
+import instrument
+import search
+
+session = st.session_state
+
+MAX_SHOWN_RESULTS = 1000
+
+
+@sessionize(label = "term_query")
+def query_controls(container = st):
+    """
+    Controls for searching the terms of all EcoTypes and celltypes/states.
+    """
+    collection = core.get( "collection" )
+    datacols = collection.columns
+
+    col1, col2, col3 = container.columns( (3, 1, 1) )
+    query = col1.text_input( "Search terms", help = "A substring (or `python`-style `regex` pattern) to search for in the terms of all EcoTypes and celltypes/states." )
+    regex = col2.checkbox( "Regex", value = False, help = "Interpret the search as a `regex` pattern." )
+    match_case = col3.checkbox( "Match case", value = False, help = "Only find terms with the same case." )
+
+    col1, col2, col3 = container.columns( (2, 2, 1) )
+    scorecols = list(datacols)
+    scorecols.remove( "log2_score" )
+    scorecols.insert( 0, "log2_score" )
+    score = col1.selectbox( "Score column", options = scorecols, help = "The column to report (and rank the results by) as the score." )
+
+    qvalcols = list(datacols)
+    qvalcols.remove( "log10_qval" )
+    qvalcols.insert( 0, "log10_qval" )
+    qval = col2.selectbox( "q-value column", options = qvalcols, help = "The column to report as the q-value." )
+
+    n = col3.number_input( "Shown results", min_value = 10, max_value = MAX_SHOWN_RESULTS, value = 100, step = 10, help = "The number of top-ranked results to show. All results can be downloaded." )
+    return dict( query = query, regex = regex, match_case = match_case, score = score, qval = qval, n = n )
+
+
+@instrument.timed
+def view_results(container = st):
+    """
+    Show the ranked results of the term search.
+    """
+    collection = core.get( "collection" )
+    query = core.get( "term_query" )
+    if not query["query"]:
+        container.info( "Enter a term to search for it in all EcoTypes and celltypes/states." )
+        return
+
+    try:
+        results = search.search( collection, query["query"], query["score"], query["qval"], query["regex"], query["match_case"] )
+    except re.error as e:
+        container.error( f"The search is not a valid `regex` pattern: {e}" )
+        return
+
+    if not len( results ):
+        container.warning( "No terms match the search." )
+        return
+
+    container.caption( f"{len(results)} matching terms in {results['EcoType'].nunique()} EcoTypes and {results[['EcoType', 'CellType']].drop_duplicates().shape[0]} celltypes/states." )
+    container.dataframe( results.head( query["n"] ) )
+
+    key = ( collection.key, query["query"], query["score"], query["qval"], query["regex"], query["match_case"] )
+    controls.download( "Download results", ( key, "tsv" ), lambda: results.to_csv( index = False, sep = "\t" ), "term_search.tsv", "text/tsv", container )
@@ -2,9 +2,11 @@
 The main user controls
 """
 
+import os
 import streamlit as st
 from wrappers import sessionize
 import core
+import columnar
 
 session = st.session_state
 
@@ -12,8 +14,18 @@ session = st.session_state
 def upload(container):
     """
     Upload a file.
+
+    If the `ECO_HELPER_VIEWER_DATA_DIR` environment variable is set, the columnar collections 
+    in that directory on the server can be opened as well.
     """
-    file = container.file_uploader( "Upload a collection here", help = "This must be a pickle file exported from `eco_helper`." )    
+    file = container.file_uploader( "Upload a collection here", help = "This must be a pickle file exported from `eco_helper` or a columnar (Arrow) file converted from one." )    
+    
+    data_dir = os.environ.get( "ECO_HELPER_VIEWER_DATA_DIR" )
+    if data_dir and not file:
+        files = sorted( i for i in os.listdir( data_dir ) if i.endswith( columnar.EXTENSIONS ) )
+        server_file = container.selectbox( "Or open a collection from the server", options = [ None ] + files, help = "Columnar collections on the server are memory-mapped and only read as far as needed." )
+        if server_file:
+            file = os.path.join( data_dir, server_file )
     return file
 
 
@@ -23,7 +35,7 @@ def inspect_summary(container):
     Inspect the summary of the collection.
     """
     current = core.get( "inspect_summary" )
-    contender = core.get( "explore_gene_sets" )
+    contender = core.get( "explore_gene_sets" ) or core.get( "search_terms" ) or core.get( "compare_collections" )
     button = container.button( "Inspect EcoType Summary", help = "View the composition of Ecotypes in a broad summary" )
     return button or (current and not contender )
 
@@ -34,7 +46,37 @@ def explore_gene_sets(container):
     Explore the gene sets of the collection.
     """
     current = core.get( "explore_gene_sets" )
-    contender = core.get( "inspect_summary" )
+    contender = core.get( "inspect_summary" ) or core.get( "search_terms" ) or core.get( "compare_collections" )
     button = container.button( "Explore Gene sets", help = "Explore the gene sets of specific cell-types in specific Ecotypes" )
     return button or (current and not contender )
 
+
+@sessionize
+def search_terms(container):
+    """
+    Search the terms of all EcoTypes and celltypes/states.
+    """
+    current = core.get( "search_terms" )
+    contender = core.get( "inspect_summary" ) or core.get( "explore_gene_sets" ) or core.get( "compare_collections" )
+    button = container.button( "Search Terms", help = "Search for terms across all Ecotypes and cell-types at once" )
+    return button or (current and not contender )
+
+
+@sessionize
+def compare_collections(container):
+    """
+    Compare the collection with a second collection.
+    """
+    current = core.get( "compare_collections" )
+    contender = core.get( "inspect_summary" ) or core.get( "explore_gene_sets" ) or core.get( "search_terms" )
+    button = container.button( "Compare Collections", help = "Compare the enrichment results with those of a second collection (e.g. of another cohort or pipeline version)" )
+    return button or (current and not contender )
+
+
+
+@sessionize
+def show_timings(container):
+    """
+    Show the timings of each rerun.
+    """
+    return container.checkbox( "Show timings", value = False, help = "Show how long each section of the last rerun took, how many rows it processed and how large its figure was." )
@@ -1,29 +1,39 @@
 """
 The main window
+
+The modules of each page (and with them `eco_helper` and the plotting backends) are only
+imported once the page is first shown, so that the welcome page starts quickly.
 """
 
 
 import os
-import darkdetect
+import functools
 import streamlit as st
 import user_input
 import controls
-import ecotype_summary
-import gene_set_explorer as explorer
 import core
+import instrument
 
 
 session = st.session_state
 
 
 loc = os.path.dirname(__file__)
-suffix = "_light" if darkdetect.isDark() else "_dark"
-viewer_logo = f"{loc}/resources/viewer{suffix}.png"
+
+
+@functools.lru_cache( maxsize = None )
+def viewer_logo():
+    """
+    The viewer logo that matches the (server's) dark or light theme.
+    """
+    import darkdetect
+    suffix = "_light" if darkdetect.isDark() else "_dark"
+    return f"{loc}/resources/viewer{suffix}.png"
 
 
 def welcome():
 
-    st.image(viewer_logo, use_column_width = True)
+    st.image(viewer_logo(), use_column_width = True)
 
     st.markdown( """
 
@@ -38,14 +48,28 @@ def welcome():
     To use the viewer, be sure to export an enrichment collection as a pickle-file via `eco_helper` and upload it here.
     """, unsafe_allow_html = True )
 
+@instrument.timed
 def side_controls():
     
-    st.sidebar.image(viewer_logo)
+    st.sidebar.image(viewer_logo())
     user_input.upload(st.sidebar)
     user_input.inspect_summary(st.sidebar)
     user_input.explore_gene_sets(st.sidebar)
-
+    user_input.search_terms(st.sidebar)
+    user_input.compare_collections(st.sidebar)
+    user_input.show_timings(st.sidebar)
+
+def collection_memory():
+    """
+    Show how much memory the loaded collection takes (before and after it was normalized).
+    """
+    memory = getattr( core.get( "collection" ), "memory", None )
+    if memory:
+        st.sidebar.caption( f"Collection memory: {memory['before'] / 2**20:.1f} MB, {memory['after'] / 2**20:.1f} MB after normalization" )
+
+@instrument.timed
 def ecotype_summary_page():
+    import ecotype_summary
 
     figure_panel, controls_panel = st.container(), st.container()
     figure_control_panel = controls_panel.expander( "Figure Settings", False )
@@ -53,19 +77,27 @@ def ecotype_summary_page():
     controls.scatter_figure_controls(figure_control_panel)
     ecotype_summary.figure_settings(figure_control_panel)
 
-    scatter_fig = ecotype_summary.view_scatterplots(figure_panel)
-    controls.download_figure( scatter_fig, "ecotypes_summary", figure_panel )
+    if ecotype_summary.summary_mode(figure_panel) == "Overview":
+        overview_fig = ecotype_summary.view_overview(figure_panel)
+        controls.download_figure( overview_fig, "ecotypes_overview", container = figure_panel )
+    else:
+        scatter_fig = ecotype_summary.view_scatterplots(figure_panel)
+        controls.download_figure( scatter_fig, "ecotypes_summary", container = figure_panel )
 
     gene_sets_fig = ecotype_summary.view_gene_sets(figure_panel)
-    controls.download_figure( gene_sets_fig, "ecotype_topmost_gene_sets", figure_panel )
+    controls.download_figure( gene_sets_fig, "ecotype_topmost_gene_sets", container = figure_panel )
 
+@instrument.timed
 def gene_set_explorer():
+    import gene_set_explorer as explorer
+    import render
 
     upper, middle_upper, middle_lower, lower = st.container(), st.container(), st.container(), st.container()
     ucol1, ucol2 = upper.columns( (1, 3) ) 
     mcol1, mcol2 = middle_upper.columns( (1, 2.5) )
 
     figure_control_panel = lower.expander( "Figure Settings", False )
+    archive_panel = lower.expander( "Download everything", False )
 
     explorer.select_dataset(ucol1)
     explorer.subsets_textfield(ucol2)
@@ -79,21 +111,65 @@ def gene_set_explorer():
     explorer.auto_drop_subsets(mcol1)
     explorer.topmost_thresholds(middle_lower)
 
-    if core.get( "which_subsets" ).get( "scatter" ):
-        subsets_fig = explorer.view_subsets(mcol2)
-        
-        controls.download_figure( subsets_fig, suffix = "subsets", container = mcol2 )
-    
+    # the figures are rendered concurrently, each into its own (pre-arranged) container as it completes
+    which = core.get( "which_subsets" )
+    if which.get( "scatter" ):
+        subsets_container = mcol2.container()
         gene_set_view_container = middle_upper
     else:
+        subsets_container = None
         gene_set_view_container = mcol2
+    fractions_container = mcol2.container()
+    topmost_container = gene_set_view_container.container()
+
+    views = dict(
+                    subsets = ( explorer.subsets_job, explorer.view_subsets, subsets_container, which.get( "scatter" ) ),
+                    fractions = ( explorer.fractions_job, explorer.view_histogram, fractions_container, which.get( "counts" ) ),
+                    topmost = ( explorer.topmost_job, explorer.view_gene_sets, topmost_container, which.get( "topmost" ) ),
+                )
+    jobs = { name : job() for name, ( job, _, _, show ) in views.items() if show }
+    with instrument.section( "render.concurrently" ):
+        for name, rendered in render.concurrently( jobs ):
+            _, view, container, _ = views[name]
+            fig = view( container, rendered )
+            controls.download_figure( fig, suffix = name, container = container )
+
+    middle_lower.markdown("---")
+    explorer.download_everything(archive_panel)
 
-    if core.get( "which_subsets" ).get( "counts" ):
-        counts_fig = explorer.view_histogram(mcol2)
-        controls.download_figure( counts_fig, suffix = "fractions", container = mcol2 )
 
-    if core.get( "which_subsets" ).get( "topmost" ):
-        topmost_fig = explorer.view_gene_sets(gene_set_view_container)
-        controls.download_figure( topmost_fig, suffix = "topmost", container = gene_set_view_container )
+@instrument.timed
+def term_search_page():
+    import term_search
 
-    middle_lower.markdown("---")
\ No newline at end of file
+    upper, lower = st.container(), st.container()
+
+    term_search.query_controls(upper)
+    upper.markdown("---")
+    term_search.view_results(lower)
+
+
+@instrument.timed
+def comparison_page():
+    import comparison
+    import compare
+
+    upper, figure_panel, controls_panel = st.container(), st.container(), st.container()
+    figure_control_panel = controls_panel.expander( "Figure Settings", False )
+    controls.scatter_figure_controls(figure_control_panel)
+
+    other = comparison.upload_other(upper)
+    if not other:
+        upper.info( "Upload a second collection to compare the loaded collection with." )
+        return
+    if core.file_id( other ) != core.get( "other_datafile_id" ):
+        core.load_other( other )
+
+    if not core.get( "other_collection" ) or not compare.ecotypes( core.get( "collection" ), core.get( "other_collection" ) ):
+        upper.warning( "The collections have no EcoTypes in common." )
+        return
+
+    comparison.comparison_settings(upper)
+    upper.markdown("---")
+    comparison.view_differential(figure_panel)
+    comparison.view_topmost_changes(figure_panel)
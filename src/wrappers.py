@@ -4,6 +4,7 @@ Wrapper functions to make it easier to use the session.
 
 import functools
 import streamlit as st
+import instrument
 
 session = st.session_state
 
@@ -37,6 +38,8 @@ def sessionize( func=None, label = None ):
     If the label is not specified, the function name will be used. If `remember` is set to True, then the value will only once be set to the session state.
     
     This can also `containerize` the function if the `container` argument is set to `True`.
+
+    The function's calls are recorded as sections of the rerun (see `instrument`).
     """
 
     if func and label is None:
@@ -46,7 +49,9 @@ def sessionize( func=None, label = None ):
 
         @functools.wraps( func )
         def wrapper( *args, **kwargs ):
-            session[label] = func( *args, **kwargs )
+            with instrument.section( f"{func.__module__}.{func.__name__}" ) as record:
+                session[label] = func( *args, **kwargs )
+                instrument.measure( record, session[label] )
             return session[label]
 
         return wrapper
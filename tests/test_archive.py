@@ -0,0 +1,51 @@
+import os
+import pytest
+
+pytest.importorskip( "eco_helper" )
+
+import archive
+import highlighting
+
+
+class _Done:
+    def done( self ):
+        return True
+
+
+def _archive( tmp_path, key ):
+    path = tmp_path / f"{key}.zip"
+    path.write_bytes( b"" )
+    result = archive.Archive( key, str( path ) )
+    result.future = _Done()
+    return result
+
+
+def test_archives_whose_file_is_gone_are_failed( tmp_path ):
+    current = _archive( tmp_path, "a" )
+    assert current.ready and not current.failed
+
+    os.remove( current.path )
+    assert current.failed and not current.ready
+
+
+def test_evicted_archives_are_failed( tmp_path, monkeypatch ):
+    monkeypatch.setattr( archive.archives, "max_entries", 1 )
+    archive.archives.clear()
+
+    first, second = _archive( tmp_path, "a" ), _archive( tmp_path, "b" )
+    archive.archives.set( "a", first )
+    archive.archives.set( "b", second )
+    assert first.failed and first.error is not None
+    assert not second.failed
+
+
+def test_unshared_datasets_are_not_cached( monkeypatch ):
+    monkeypatch.setattr( highlighting, "_highlight", lambda dataset, ref_col, subsets: "highlighted" )
+    highlighting.results.clear()
+
+    class Dataset:
+        key = "dataset"
+        shared = False
+
+    assert highlighting.highlighted( Dataset(), "Term", {} ) == "highlighted"
+    assert len( highlighting.results ) == 0
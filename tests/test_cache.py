@@ -0,0 +1,17 @@
+import cache
+
+
+def test_on_evict_is_called_with_evicted_entries():
+    evicted = []
+    lru = cache.LRUCache( max_entries = 1, on_evict = lambda key, value: evicted.append( ( key, value ) ) )
+    lru.set( "a", 1 )
+    lru.set( "b", 2 )
+    assert evicted == [ ( "a", 1 ) ]
+
+
+def test_clear_all_empties_every_cache():
+    first, second = cache.LRUCache(), cache.LRUCache( max_entries = 2 )
+    first.set( "a", 1 )
+    second.set( "b", 2 )
+    cache.clear_all()
+    assert len( first ) == 0 and len( second ) == 0
@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+import pytest
+import columnar
+
+
+def _collection():
+    return {
+                "E0" : pd.DataFrame( { "CellType" : [ "A", "B" ], "Term" : [ "x", "y" ], "log10_qval" : np.array( [ 1, 2 ], dtype = np.int64 ), "genes" : [ None, None ] } ),
+                "E1" : pd.DataFrame( { "CellType" : [ "A", "C", "C" ], "Term" : [ "x", "y", "z" ], "log10_qval" : [ 1.5, np.nan, 3.0 ], "genes" : [ "a", None, "b;c" ] } ),
+            }
+
+
+def _values( column ):
+    return [ None if pd.isna( i ) else i for i in column ]
+
+
+@pytest.mark.parametrize( "stream", [ False, True ] )
+def test_ecotypes_with_different_dtypes_are_written( tmp_path, stream ):
+    collection = _collection()
+    columnar.write( collection, tmp_path / "collection.arrow", stream = stream )
+    lazy = columnar.LazyCollection( str( tmp_path / "collection.arrow" ) )
+
+    assert list( lazy.keys() ) == [ "E0", "E1" ]
+    for ecotype, df in collection.items():
+        read = lazy.frame( ecotype )
+        assert read["log10_qval"].dtype == np.float64
+        np.testing.assert_array_equal( read["log10_qval"].to_numpy(), df["log10_qval"].to_numpy( dtype = float ) )
+        assert list( read["Term"] ) == list( df["Term"] )
+        assert _values( read["genes"] ) == _values( df["genes"] )
+
+
+def test_streams_are_read_up_to_the_requested_ecotype( tmp_path ):
+    collection = { f"E{i}" : pd.DataFrame( { "Term" : [ f"term {i}" ], "log2_score" : [ float( i ) ] } ) for i in range( 3 ) }
+    columnar.write( collection, tmp_path / "collection.arrow", stream = True )
+    lazy = columnar.LazyCollection( str( tmp_path / "collection.arrow" ) )
+
+    assert list( lazy.keys() ) == [ "E0", "E1", "E2" ]
+    assert len( lazy._batches ) == 0
+    assert lazy.frame( "E1" )["Term"].tolist() == [ "term 1" ]
+    assert len( lazy._batches ) == 2
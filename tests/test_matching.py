@@ -0,0 +1,32 @@
+import re
+import pytest
+import matching
+
+
+def _labels( subsets, values ):
+    """
+    The labels of the highlighting of `visualise`: each pattern is searched on its own and the last matching subset wins.
+    """
+    labels = []
+    for value in values:
+        label = matching.DEFAULT_LABEL
+        for name, patterns in subsets.items():
+            patterns = [ patterns ] if isinstance( patterns, str ) else patterns
+            if any( re.search( i, value ) for i in patterns ):
+                label = name
+        labels.append( label )
+    return labels
+
+
+VALUES = [ "apoptosis", "Apoptosis regulation", "aa", "bb", "ab", "cell death", "immune response", "Immune cell" ]
+
+
+@pytest.mark.parametrize( "subsets", [
+                                        { "death" : [ "apopto", "cell( |-)death" ], "immune" : "immun" },
+                                        { "death" : "(?i)apoptosis", "immune" : [ "immun" ] },
+                                        { "death" : [ "(?i:apoptosis)", "death" ], "immune" : "(?i)immune" },
+                                        { "repeat" : [ "(a)\\1", "(b)\\1" ] },
+                                        { "repeat" : "(?P<x>a)(?P=x)", "other" : "(b)\\1" },
+                                    ] )
+def test_labels_match_per_pattern_search( subsets ):
+    assert list( matching.Matcher( subsets ).match( VALUES ) ) == _labels( subsets, VALUES )
@@ -0,0 +1,77 @@
+import gc
+import io
+import pickle
+import weakref
+import pytest
+import numpy as np
+import pandas as pd
+import render
+import store
+
+
+class _Container:
+    def image( self, *args, **kwargs ):
+        pass
+
+    def plotly_chart( self, *args, **kwargs ):
+        pass
+
+
+def _build( collection = None ):
+    def build():
+        from matplotlib.figure import Figure
+        fig = Figure()
+        fig.subplots().scatter( range( 1000 ), range( 1000 ) )
+        return fig, pd.DataFrame( { "Term" : [ f"term {i}" for i in range( 1000 ) ] } )
+    return build
+
+
+def _plotly( collection ):
+    def build():
+        import plotly.graph_objs as go
+        df = collection.frame( "E0", [ "log2_score" ] )
+        return go.Figure( go.Scatter( y = df["log2_score"] ) ), df
+    return build
+
+
+def _collection( seed ):
+    rng = np.random.default_rng( seed )
+    return {
+                f"E{i}" : pd.DataFrame( {
+                                            "CellType" : rng.choice( [ "A", "B" ], 20 ),
+                                            "Term" : [ f"term {seed} {j}" for j in range( 20 ) ],
+                                            "log2_score" : rng.normal( size = 20 ),
+                                        } )
+                for i in range( 2 )
+            }
+
+
+def test_matplotlib_figures_are_kept_pickled():
+    render.figures.clear()
+    rendered = render.figure( _Container(), dict( figure = "test" ), _build(), "matplotlib" )
+    assert not any( type( i ).__name__ == "Figure" or callable( i ) for i in vars( rendered ).values() )
+    assert type( rendered.figure ).__name__ == "Figure"
+
+
+def test_nbytes_counts_the_pickled_figure_and_the_table_deeply():
+    rendered = render.figure( _Container(), dict( figure = "test", deep = True ), _build(), "matplotlib" )
+    assert rendered.nbytes == len( rendered.payload ) + len( rendered._pickled ) + rendered.data.memory_usage( deep = True ).sum()
+
+
+@pytest.mark.parametrize( "backend", [ "matplotlib", "plotly" ] )
+def test_rendered_figures_do_not_keep_evicted_collections_alive( backend, monkeypatch ):
+    monkeypatch.setattr( store.collections, "max_entries", 1 )
+    store.collections.clear()
+    render.figures.clear()
+
+    refs = []
+    for seed in range( 3 ):
+        collection = store.open_collection( io.BytesIO( pickle.dumps( _collection( seed ) ) ) )
+        build = _plotly( collection ) if backend == "plotly" else _build( collection )
+        render.figure( _Container(), dict( figure = "test", collection = collection.key ), build, backend )
+        refs.append( weakref.ref( collection ) )
+        del collection, build
+    gc.collect()
+
+    assert sum( ref() is not None for ref in refs ) == 1
+    assert len( render.figures ) == 3
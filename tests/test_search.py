@@ -0,0 +1,40 @@
+import re
+import pandas as pd
+import pytest
+import store
+import search
+
+TERMS = [ "apoptosis", "Apoptotic process", "regulation of apoptosis", "éclair signaling", "cell death", "aa bb", "a.b+c", "cycle 12" ]
+
+
+@pytest.fixture
+def index():
+    df = pd.DataFrame( { "CellType" : [ "A", "B" ] * len( TERMS ), "Term" : [ i for i in TERMS for _ in range( 2 ) ] } )
+    return search.TermIndex( store.FrozenCollection( { "E1" : df }, key = None ) )
+
+
+@pytest.mark.parametrize( "query", [
+                                        r"\x61popto", 
+                                        r"apop\x74osis", 
+                                        r"\141poptosis", 
+                                        r"éclair", 
+                                        r"\N{LATIN SMALL LETTER E WITH ACUTE}clair", 
+                                        r"\U00000061poptotic",
+                                        r"(a)\1 bb", 
+                                        r"\bcell\s+death", 
+                                        r"a\.b\+c", 
+                                        r"cycle \d\d", 
+                                        r"apopto(sis|tic)",
+                                    ] )
+@pytest.mark.parametrize( "match_case", [ False, True ] )
+def test_search_finds_every_match( index, query, match_case ):
+    pattern = re.compile( query, 0 if match_case else re.IGNORECASE )
+    expected = { i for i in TERMS if pattern.search( i ) }
+    found = { index.terms[i] for i in index.matching( query, regex = True, match_case = match_case ) }
+    assert found == expected
+
+
+def test_code_escapes_are_not_required_literals():
+    assert search.required_literals( re.compile( r"\x61popto" ) ) == [ "popto" ]
+    assert search.required_literals( re.compile( r"apop\x74osis" ) ) == [ "apop", "osis" ]
+    assert search.required_literals( re.compile( r"\141poptosis" ) ) == [ "poptosis" ]
@@ -0,0 +1,37 @@
+import gc
+import io
+import pickle
+import weakref
+import numpy as np
+import pandas as pd
+import store
+import indexes
+
+
+def _collection( seed ):
+    rng = np.random.default_rng( seed )
+    return { 
+                f"E{i}" : pd.DataFrame( {
+                                            "CellType" : rng.choice( [ "A", "B" ], 20 ),
+                                            "Term" : [ f"term {seed} {j}" for j in range( 20 ) ],
+                                            "log2_score" : rng.normal( size = 20 ),
+                                        } )
+                for i in range( 2 )
+            }
+
+
+def test_evicted_collections_are_released_with_their_derived_structures( monkeypatch ):
+    monkeypatch.setattr( store.collections, "max_entries", 2 )
+    store.collections.clear()
+    store.derived.clear()
+
+    refs = []
+    for seed in range( 6 ):
+        collection = store.open_collection( io.BytesIO( pickle.dumps( _collection( seed ) ) ) )
+        indexes.of( collection )
+        refs.append( weakref.ref( collection ) )
+        del collection
+    gc.collect()
+
+    assert sum( ref() is not None for ref in refs ) == 2
+    assert len( store.derived ) == 2
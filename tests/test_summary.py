@@ -0,0 +1,29 @@
+import pandas as pd
+import store
+import summary
+
+
+def test_top_terms_stay_within_their_celltype():
+    df = pd.DataFrame( {
+                            "CellType" : [ "A", "A", "B", "B", "B", "B" ],
+                            "Term" : [ "a1", "a2", "b1", "b2", "b3", "b4" ],
+                            "log2_score" : [ 1.0, 2.0, 1.0, 2.0, 3.0, 4.0 ],
+                            "log10_qval" : [ 1.0, 2.0, 1.0, 2.0, 3.0, 4.0 ],
+                        } )
+    collection = store.FrozenCollection( { "E1" : df } )
+    table = summary.summarize( collection, "log2_score", "log10_qval", 0.0, 0.0, n_top = 3 ).set_index( "CellType" )
+
+    assert table.loc[ "A", "top terms" ] == "a2; a1"
+    assert table.loc[ "B", "top terms" ] == "b4; b3; b2"
+    assert table.loc[ "A", "terms" ] == 2
+    assert table.loc[ "B", "above thresholds" ] == 4
+
+
+def test_only_numeric_columns_are_summarized():
+    collection = store.FrozenCollection( { "E1" : pd.DataFrame( { "CellType" : [ "A" ], "Term" : [ "a" ], "log2_score" : [ 1 ], "log10_qval" : [ 1.0 ] } ) } )
+    assert summary.numeric_columns( collection, [ "Term", "log2_score", "log10_qval", "CellType" ] ) == [ "log2_score", "log10_qval" ]
+
+
+def test_empty_summaries_are_pivoted():
+    table = summary.summarize( store.FrozenCollection( {} ), "log2_score", "log10_qval", 0.0, 0.0 )
+    assert summary.pivot( table, "terms" ).empty